@@ -1,5 +1,7 @@
 
 
+import numpy as np
+
 from constants import BoardElement
 from point import Point
 import constants
@@ -36,40 +38,69 @@ class StaticActions:
 
         self.all_actions = move_actions + wall_actions
 
+        # action -> index, so going from an action object back to its index is one hash lookup
+        self.action_indexes = {action: index for index, action in enumerate(self.all_actions)}
+
+        # flipped_indexes[index] = index of the same action seen with the board turned 180 degrees (TopAgent's view).
+        # Turning the board twice changes nothing, so the same array maps both ways
+        self.flipped_indexes = np.array([self.action_indexes[self.flip_action(action, board_size)] for action in self.all_actions])
+
+        # mirrored_indexes[index] = index of the same action with the board mirrored left to right, see mirror_action.
+        # Maps both ways too, and works in either agent's perspective since mirroring and flipping don't interfere
+        self.mirrored_indexes = np.array([self.action_indexes[self.mirror_action(action, board_size)] for action in self.all_actions])
+
+
+
+    def flip_action(self, action, board_size):
+        """ the action as it looks with the board flipped horizontally and vertically """
+        if isinstance(action, MoveAction):
+            return MoveAction(Point(-action.direction.X, -action.direction.Y))
+        # orientation doesn't change
+        return WallAction(Point(board_size - action.position.X - 2, board_size - action.position.Y - 2), action.orientation)
+
+
+    def mirror_action(self, action, board_size):
+        """ the action as it looks with the board mirrored left to right """
+        if isinstance(action, MoveAction):
+            return MoveAction(Point(-action.direction.X, action.direction.Y))
+        return WallAction(Point(board_size - action.position.X - 2, action.position.Y), action.orientation)
 
 
     def get_index_of_action(self, action):
         """ gets index of an action, used by human players who get their actions form
             mouse clicks and therfore don't immediately have access to the action's index
             The index is what's fed to the Neural net work so it's necesary for learning """
-        if isinstance(action, MoveAction):
-            return self.get_index_of_move_action(action)
-        if isinstance(action, WallAction):
-            return self.get_index_of_wall_action(action)
+        return self.action_indexes[action]
 
     def get_index_of_move_action(self, action):
-        return self.move_actions.index(action)
+        return self.action_indexes[action]
     
     def get_index_of_wall_action(self, action):
-        return len(self.move_actions) + self.wall_actions.index(action)
+        return self.action_indexes[action]
 
 
 class MoveAction:
     def __init__(self, direction):
         self.direction = direction
+        self.hash = hash(direction)
 
     def __eq__(self, other):
-        if other == None:
-            return False
-        return self.direction == other.direction
+        return isinstance(other, MoveAction) and self.direction == other.direction
+
+    # needed for StaticActions.action_indexes
+    def __hash__(self):
+        return self.hash
 
 
 class WallAction:
     def __init__(self, position, orientation):
         self.position = position
         self.orientation = orientation
+        self.hash = hash((position, orientation))
         
     def __eq__(self, other):
-        if other == None:
-            return False
-        return self.position == other.position and self.orientation == other.orientation
\ No newline at end of file
+        return isinstance(other, WallAction) and self.position == other.position and self.orientation == other.orientation
+
+    # needed for StaticActions.action_indexes
+    def __hash__(self):
+        return self.hash
\ No newline at end of file
@@ -0,0 +1,187 @@
+import random
+import queue
+import multiprocessing
+
+import numpy as np
+
+from headless_game import HeadlessQuoridor
+from model_backends import create_session
+from memory import MemoryInstance
+
+import constants
+from constants import BoardElement
+
+
+
+def run_actor(seed, transition_queue, shared_weights, weights_version, stop_event):
+    """ Body of an actor process: plays self-play games forever with its own inference copy of the model,
+        sending transitions to the learner in chunks of ACTOR_CHUNK_SIZE and picking up new weights between chunks.
+        Each chunk is (transitions, statistics), a transition being (agent_name, state, action, reward, next_state, done)
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    # actors only act and never fill their memories, the replay files and checkpoints belong to the learner
+    constants.REPLAY_MEMORY_FOLDER = None
+    constants.RESTORE = False
+    # and only ever predict, which numpy does without a session call per prediction. Flat weights are
+    # laid out the same by both backends, so a numpy actor can load a tensorflow learner's
+    constants.MODEL_BACKEND = constants.ACTOR_MODEL_BACKEND
+
+    with create_session() as sess:
+        game = HeadlessQuoridor(sess)
+
+        local_version = load_weights(game.model, shared_weights, weights_version)
+        transitions = []
+        for agent_name, memory_instance in game.transitions():
+            transitions.append((agent_name,) + memory_instance.asTuple())
+            if len(transitions) < constants.ACTOR_CHUNK_SIZE:
+                continue
+
+            # statistics since the last chunk, the learner adds them up over all the actors
+            statistics = (dict(game.victories), game.abandoned_games, game.sum_game_lengths, game.reward_sum,
+                          {name: agent.exploration_probability for name, agent in game.agents.items()})
+            game.victories = {BoardElement.AGENT_TOP: 0, BoardElement.AGENT_BOT: 0}
+            game.abandoned_games = 0
+            game.sum_game_lengths = 0
+            game.reward_sum = 0
+
+            transition_queue.put((transitions, statistics))
+            transitions = []
+            if stop_event.is_set():
+                break
+            if weights_version.value != local_version:
+                local_version = load_weights(game.model, shared_weights, weights_version)
+
+
+
+def load_weights(model, shared_weights, weights_version):
+    """ loads the learner's latest weights into model, returns their version """
+    with shared_weights.get_lock():
+        version = weights_version.value
+        flat_weights = np.frombuffer(shared_weights.get_obj(), dtype=np.float32).copy()
+    model.set_flat_weights(flat_weights)
+    return version
+
+
+
+class ActorPool:
+    """ Self-play spread over num_actors processes, with this process as the only learner.
+
+        Actors play with an inference copy of the model and stream their transitions back through a queue,
+        the learner (the HeadlessQuoridor passed in, which owns the real model and the agents' memories)
+        remembers them and trains. Every WEIGHT_BROADCAST_FREQUENCY training steps the learner writes its
+        weights as one flat float32 array into shared memory, and actors load it when they see the version change.
+    """
+    def __init__(self, game, num_actors):
+        self.game = game
+        self.model = game.model
+        self.num_actors = num_actors
+
+        # tensorflow doesn't survive a fork, every actor starts a fresh interpreter
+        self.context = multiprocessing.get_context('spawn')
+        self.transition_queue = self.context.Queue(maxsize=4 * num_actors)
+        self.shared_weights = self.context.Array('f', self.model.num_weights)
+        self.weights_version = self.context.Value('i', 0)
+        self.stop_event = self.context.Event()
+        self.processes = []
+
+        self.train_steps = 0
+
+
+
+    def start(self):
+        """ publishes the current weights and starts the actors """
+        self.broadcast_weights()
+        for actor_id in range(self.num_actors):
+            seed = random.getrandbits(32)
+            process = self.context.Process(target=run_actor, daemon=True,
+                args=(seed, self.transition_queue, self.shared_weights, self.weights_version, self.stop_event))
+            process.start()
+            self.processes.append(process)
+
+
+
+    def broadcast_weights(self):
+        """ copies the learner's weights into shared memory for the actors to pick up """
+        flat_weights = self.model.get_flat_weights()
+        with self.shared_weights.get_lock():
+            np.frombuffer(self.shared_weights.get_obj(), dtype=np.float32)[:] = flat_weights
+            self.weights_version.value += 1
+
+
+
+    def train(self, num_games):
+        """ learns from the actors' games until num_games of them have finished """
+        last_update = self.game.games
+        while self.game.games < num_games:
+            transitions, statistics = self.transition_queue.get()
+            self.add_statistics(statistics)
+
+            learning_agents = set()
+            for agent_name, state, action, reward, next_state, done in transitions:
+                self.game.agents[agent_name].memory.add_sample(MemoryInstance(state, action, reward, next_state, done))
+                learning_agents.add(agent_name)
+
+            # one training step per agent per chunk, acting is what the actors are for
+            for agent_name in learning_agents:
+                self.game.agents[agent_name].q_learn()
+                self.train_steps += 1
+                if self.train_steps % constants.WEIGHT_BROADCAST_FREQUENCY == 0:
+                    self.broadcast_weights()
+
+            # print an update or us humans to read
+            if self.game.games - last_update >= constants.PRINT_UPDATE_FREQUENCY:
+                print('\nEpoch {} of {}'.format(self.game.games, num_games))
+                self.game.print_details(self.game.games - last_update)
+                last_update = self.game.games
+
+
+
+    def add_statistics(self, statistics):
+        """ adds an actor's statistics to the learner's, which is what print_details reports """
+        victories, abandoned_games, sum_game_lengths, reward_sum, exploration_probabilities = statistics
+        for name, count in victories.items():
+            self.game.victories[name] += count
+            self.game.games += count
+        self.game.abandoned_games += abandoned_games
+        self.game.sum_game_lengths += sum_game_lengths
+        self.game.reward_sum += reward_sum
+        # the learner's agents never act, they just show how far the actors' exploration has decayed
+        for name, exploration_probability in exploration_probabilities.items():
+            self.game.agents[name].exploration_probability = exploration_probability
+
+
+
+    def stop(self):
+        """ stops the actors, emptying the queue so none of them is stuck putting a last chunk """
+        self.stop_event.set()
+        while any(process.is_alive() for process in self.processes):
+            try:
+                self.transition_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+
+
+def main():
+    """ Trains like headless_game.py does, with NUM_ACTORS processes playing the games """
+    with create_session() as sess:
+        game = HeadlessQuoridor(sess)
+        actor_pool = ActorPool(game, constants.NUM_ACTORS)
+
+        print("Learning Initiated...")
+        actor_pool.start()
+        try:
+            actor_pool.train(constants.NUM_GAMES)
+        finally:
+            actor_pool.stop()
+            game.checkpointer.close()
+    print('Simulation complete')
+
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 import numpy as np
-import tensorflow as tf
 import random
 import os
 import math
@@ -7,7 +6,9 @@ import math
 from point import Point
 from actions import StaticActions, MoveAction, WallAction
 
-from memory import Memory, MemoryInstance
+from memory import Memory, PrioritizedMemory, MemoryInstance
+from zobrist import TRANSPOSITIONS
+from encoder import mirrored_state_indexes
 
 #from model import Model
 
@@ -23,13 +24,26 @@ class Agent:
         looks like to the global state. For instance, when TopAgent moves up, it's a down move from the board's perspective. but up from the agent's perspective
     """
 
-    def __init__(self, sess, static_actions, model, name):
+    def __init__(self, sess, static_actions, model, name, memory_folder=None):
         self.sess = sess
 
         # size of the state vector that is fed into the NN
         self.state_size = constants.BOARD_SIZE*2 + 1
 
-        self.memory = Memory(constants.MEMORY_SIZE)
+        # an agent whose model can't learn (an exported policy) has nothing to remember
+        self.memory = None
+        if model.trainable:
+            # in memory_folder the memories survive between runs, so training can pick up where it left off.
+            # only the training runners pass one (constants.REPLAY_MEMORY_FOLDER), agents that only play
+            # never touch their replay files
+            memory_path = None
+            if memory_folder is not None:
+                os.makedirs(memory_folder, exist_ok=True)
+                memory_path = os.path.join(memory_folder, name + '.replay')
+            if constants.USE_PRIORITIZED_REPLAY:
+                self.memory = PrioritizedMemory(constants.MEMORY_SIZE, model.get_num_states(), memory_path)
+            else:
+                self.memory = Memory(constants.MEMORY_SIZE, model.get_num_states(), memory_path)
         # model is passed here in order to ensure there is only one model object that trains and performs q-learning
         self.model = model
 
@@ -37,6 +51,15 @@ class Agent:
         # action_indexes to actions fast
         self.static_actions = static_actions
 
+        # perspective_indexes[agent action index] = board action index, so a legal action mask (or Q vector) from the
+        # board's perspective can be viewed from this agent's perspective with one fancy index. TopAgent flips it
+        self.perspective_indexes = np.arange(len(static_actions.all_actions))
+
+        # the rules don't care about left and right, so every transition is also true mirrored. These permute
+        # a state vector and an action index into their mirror images, see mirror_batch
+        self.mirrored_state_indexes = mirrored_state_indexes()
+        self.mirrored_action_indexes = static_actions.mirrored_indexes
+
         # probability of taking a random aciton, which decays as the training goes on.
         self.exploration_probability = constants.STARTING_EXPLORATION_PROBABILITY
         self.steps = 1
@@ -57,6 +80,26 @@ class Agent:
             records (S, A, S', R) as a memory
             trains the NN on a batch of recent memories
         """
+        memory_instance = self.act(board_state, only_inference, valid_human_action)
+        if memory_instance == None:
+            return None # return None to signify that this game should be abandoned
+
+        # an exported policy (numpy_policy.NumpyPolicy) only plays
+        if self.model.trainable:
+            # memory is our training examples
+            self.memory.add_sample(memory_instance)
+            # learn off a batch of recent memories
+            self.q_learn()
+
+        return memory_instance.reward
+
+
+
+    def act(self, board_state, only_inference, valid_human_action = None):
+        """ take_action without the learning: picks an action, applies it to the state and returns
+            the (S, A, R, S') MemoryInstance from this agent's perspective, or None if there was nothing legal to do.
+            Training code that wants the transitions for itself (see headless_game.py) calls this directly
+        """
         # child method is called here.
         state_vector = self.get_perspective_state(board_state)
 
@@ -69,7 +112,7 @@ class Agent:
             # in small grids, agents can become stuck if they are next to a wall and the enemy (can't move)
             # and thus action_index will be None in this case
             if action_index == None:
-                return None # return None to signify that this game should be abandoned
+                return None
             else:
                 action = self.static_actions.all_actions[action_index]
         else:
@@ -90,17 +133,18 @@ class Agent:
 
         next_state_vector = self.get_perspective_state(board_state)
 
-        # memory is our training examples
-        self.memory.add_sample(MemoryInstance(state_vector, action_index, reward, next_state_vector))
-        # learn off a batch of recent memories
-        self.q_learn()
+        self.decay_exploration()
+
+        return MemoryInstance(state_vector, action_index, reward, next_state_vector, board_state.winner is not None)
 
-        self.steps += 1
+
+
+    def decay_exploration(self, steps=1):
+        """ counts steps taken by this agent and decays the exploration probability accordingly """
+        self.steps += steps
         self.exploration_probability = constants.ENDING_EXPLORATION_PROBABILITY + (constants.STARTING_EXPLORATION_PROBABILITY - constants.ENDING_EXPLORATION_PROBABILITY) \
             * math.exp(-constants.EXPLORATION_PROBABILITY_DECAY * self.steps)
 
-        return reward
-
 
 
     def random_action(self, board_state):
@@ -110,43 +154,49 @@ class Agent:
             but in the real game move actions are more frequent, so we want our exploration
             phase of training to reflect this and select move much more often than wall """
 
+        legal_mask = self.legal_action_mask(board_state)
         if random.random() < constants.MOVE_ACTION_PROBABILITY:
-            actions = self.static_actions.move_actions
-        else:
-            actions = self.static_actions.all_actions
-        
-        action_indexes = [i for i in range(len(actions))]
-        random.shuffle(action_indexes)
+            legal_mask[len(self.static_actions.move_actions):] = False
 
-        return self.first_legal_action(action_indexes, board_state)
+        legal_indexes = np.flatnonzero(legal_mask)
+        if len(legal_indexes) == 0:
+            return None
+        return int(random.choice(legal_indexes))
 
 
     def greedy_action(self, state_vector, board_state):
         """ Returns a greedy action taken from the model:
             1. gets the Q values from the model given the state
-            2. sorts them
-            3. go through them until a valid action is found
-            4. return the action or of none are found, return a random valid action
+            2. masks out the illegal actions
+            3. returns the legal action with the highest Q value, or None if there are no legal actions
         """
+        legal_mask = self.legal_action_mask(board_state)
+        if not legal_mask.any():
+            return None
 
-        q_values = self.model.predict_one(state_vector)
-        q_values = q_values.flatten()
+        if constants.USE_TRANSPOSITION_TABLE:
+            # the Q values may already be known, then the masked argmax is cheaper here than a trip to the model
+            q_values = self.q_values(state_vector, board_state)
+            return int(np.argmax(np.where(legal_mask, q_values, -np.inf)))
+        # otherwise the model masks and picks in the same call it predicts in
+        return int(self.model.predict_greedy(state_vector.reshape(1, -1), legal_mask.reshape(1, -1))[0])
 
-        _, action_indexes = self.sess.run(tf.nn.top_k(q_values, len(q_values)))
-        action_indexes = action_indexes.tolist()
 
-        # return the legal action with the highest q-value
-        return self.first_legal_action(action_indexes, board_state)
 
+    def q_values(self, state_vector, board_state):
+        """ the model's Q values for this state, from the transposition table if this position was already predicted """
+        if constants.USE_TRANSPOSITION_TABLE:
+            return TRANSPOSITIONS.q_values(self.model, state_vector, board_state, self.name)
+        return self.model.predict_one(state_vector).flatten()
 
 
-    def first_legal_action(self, action_indexes, board_state):
-        """ takes the first legal action found and returns it 
-            This is used to take the highest legal Q valued action
-        """
-        for action_index in action_indexes:
-            if self.is_legal_action(action_index, board_state):
-                return action_index
+    def legal_action_mask(self, board_state):
+        """ the board state's legal action mask, reordered into this agent's action indexes """
+        if constants.USE_TRANSPOSITION_TABLE:
+            legal_mask = TRANSPOSITIONS.legal_action_mask(board_state, self.name)
+        else:
+            legal_mask = board_state.legal_action_mask(self.name)
+        return legal_mask[self.perspective_indexes]
 
 
     def is_legal_action(self, action_index, board_state):
@@ -158,24 +208,11 @@ class Agent:
 
 
     
-    def get_perspective_state(self, board_state):
-        """ Gets the agent's perspective of the state (as a vector)
+    def get_perspective_state(self, board_state, out=None):
+        """ Gets the agent's perspective of the state (as a float32 vector, written into out if given)
             TopAgent overrides this since it has a different perspecive than BottomAgent
          """
-        full_grid_size = board_state.full_grid_size
-        grid = board_state.build_grid(BoardElement.AGENT_BOT, BoardElement.AGENT_TOP)
-
-        vector = []
-        for y in range(full_grid_size):
-            for x in range(full_grid_size):
-                vector.append(grid[x][y])
-
-        # my walls, then enemy walls
-        vector.append(board_state.wall_counts[BoardElement.AGENT_BOT])
-        vector.append(board_state.wall_counts[BoardElement.AGENT_TOP])
-
-        vector = np.array(vector)
-        return vector
+        return board_state.encode_perspective(BoardElement.AGENT_BOT, BoardElement.AGENT_TOP, False, out)
 
 
 
@@ -188,39 +225,15 @@ class Agent:
             Each training example is (state, action, next state, reward)
             Q is R + gamme * max(s', a')
         """
-        batch = self.memory.sample(self.model.get_batch_size())
-
-        states = np.array([val[0] for val in batch])
-        # When we first start training, some of the memories of examples could be null (not enough for a full batch yet)
-        next_states = np.array([(np.zeros(self.model.get_num_states()) if val[3] is None else val[3]) for val in batch])
-
-        # predict Q(s,a) given the batch of states
-        q_s_a = self.model.predict_batch(states)
-
-        # predict Q(s',a') - so that we can do gamma * max(Q(s'a')) below
-        q_s_a_d = self.model.predict_batch(next_states)
-
-        # setup training arrays
-        x = np.zeros((len(batch), self.model.get_num_states()))
-        y = np.zeros((len(batch), self.model.get_num_actions()))
-
-        # convert each memory to a trainable example via q-lerning method
-        for i, b in enumerate(batch):
-            state, action, reward, next_state = b[0], b[1], b[2], b[3]
-
-            # get the current q values for all actions in state
-            current_q = q_s_a[i]
-
-            # update the q value for action
-            if next_state is None:
-                # in this case, the game completed after action, so there is no max Q(s',a') prediction possible
-                current_q[action] = reward
-            else:
-                current_q[action] = reward + constants.GAMMA * np.amax(q_s_a_d[i])
-            x[i] = state
-            y[i] = current_q
+        rows, sample_weights = self.memory.sample_rows(self.model.get_batch_size())
+        states, actions, rewards, next_states, dones = self.memory.batch(rows)
+        if constants.USE_MIRROR_AUGMENTATION:
+            states, actions, next_states = self.mirror_batch(states, actions, next_states)
 
-        _, l = self.model.train_batch(x, y)
+        # Q(s,a), max(Q(s',a')), the targets and the training all happen in one call to the model.
+        # prioritized memory weights each example to undo the bias of its sampling, and learns how surprising they were
+        l, td_errors = self.model.train_q_batch(states, actions, rewards, next_states, dones, sample_weights)
+        self.memory.update_priorities(rows, td_errors)
 
         self.game_loss = l
         self.recent_loss += l
@@ -228,6 +241,17 @@ class Agent:
 
 
 
+    def mirror_batch(self, states, actions, next_states):
+        """ mirrors a random half of the batch's transitions left to right. Rewards and dones stay the same,
+            and so do the memory's priorities, a mirrored transition is exactly as surprising as the original """
+        mirrored = np.random.rand(len(actions)) < 0.5
+        states[mirrored] = states[mirrored][:, self.mirrored_state_indexes]
+        next_states[mirrored] = next_states[mirrored][:, self.mirrored_state_indexes]
+        actions[mirrored] = self.mirrored_action_indexes[actions[mirrored]]
+        return states, actions, next_states
+
+
+
     def get_exploration_probability(self):
         return self.exploration_probability
 
@@ -255,46 +279,29 @@ class TopAgent(Agent):
     """ Agent that starts out at the top of the screen and has a perspective that the board is 
         flipped horizontally and vertically
     """
-    def __init__(self, sess, static_actions, model):
-        Agent.__init__(self, sess, static_actions, model, BoardElement.AGENT_TOP)
+    def __init__(self, sess, static_actions, model, memory_folder=None):
+        Agent.__init__(self, sess, static_actions, model, BoardElement.AGENT_TOP, memory_folder)
+        self.perspective_indexes = static_actions.flipped_indexes
 
 
-    def get_perspective_state(self, board_state):
-        """ appends grid squres to the state vector in reversed fashion, effectively flipping the
-            horizontal and verical axes. ALso append BoardElement.AGENT_TOP's wall count before
-            BoardElement.AGENT_BOT's wll count becaue the current agent must come first to preserve consistency 
+    def get_perspective_state(self, board_state, out=None):
+        """ the grid in reversed order, effectively flipping the horizontal and verical axes. ALso puts
+            BoardElement.AGENT_TOP's wall count before BoardElement.AGENT_BOT's wll count becaue the
+            current agent must come first to preserve consistency 
         """
-
-        full_grid_size = board_state.full_grid_size
-        grid = board_state.build_grid(BoardElement.AGENT_TOP, BoardElement.AGENT_BOT)
-
-        vector = []
-        for y in reversed(range(full_grid_size)):
-            for x in reversed(range(full_grid_size)):
-                vector.append(grid[x][y])
-
-        # my walls, then enemy walls
-        vector.append(board_state.wall_counts[BoardElement.AGENT_TOP])
-        vector.append(board_state.wall_counts[BoardElement.AGENT_BOT])
-
-        vector = np.array(vector)
-        return vector
+        return board_state.encode_perspective(BoardElement.AGENT_TOP, BoardElement.AGENT_BOT, True, out)
 
 
 
 
     def action_to_global_and_back(self, agent_action):
-        """ Actions are also flipped on both axes """
-        if isinstance(agent_action, MoveAction):
-            state_action = MoveAction(Point(-agent_action.direction.X, -agent_action.direction.Y))
-            
-        else:
-            agent_wall_pos = agent_action.position
-            wall_pos = Point(constants.BOARD_SIZE - agent_wall_pos.X - 2, constants.BOARD_SIZE - agent_wall_pos.Y - 2)
-            # orientation doesn't change
-            state_action = WallAction(wall_pos, agent_action.orientation)
-
-        return state_action
+        """ Actions are also flipped on both axes. Looked up through the precomputed permutation,
+            so no new action objects are made """
+        action_index = self.static_actions.action_indexes.get(agent_action)
+        if action_index is None:
+            # not one of the static actions (can't be legal either), flip it the long way
+            return self.static_actions.flip_action(agent_action, constants.BOARD_SIZE)
+        return self.static_actions.all_actions[self.perspective_indexes[action_index]]
 
 
 
@@ -304,12 +311,12 @@ class TopAgent(Agent):
 class BottomAgent(Agent):
     """ Bottom agent has nothing to override because it's perspecitve is the same as
         the boards and us humans"""
-    def __init__(self, sess, static_actions, model):
-        Agent.__init__(self, sess, static_actions, model, BoardElement.AGENT_BOT)
+    def __init__(self, sess, static_actions, model, memory_folder=None):
+        Agent.__init__(self, sess, static_actions, model, BoardElement.AGENT_BOT, memory_folder)
 
 
-    def get_perspective_state(self, board_state):
-        return super().get_perspective_state(board_state)
+    def get_perspective_state(self, board_state, out=None):
+        return super().get_perspective_state(board_state, out)
 
 
     def action_to_global_and_back(self, agent_action):
@@ -1,14 +1,14 @@
 
 import heapq
 
-#spaces are now point objects, actions are now actions
+#spaces can be any hashable, orderable node: Points or plain square numbers
 def a_star(get_neighbors, start_position, goal_test, heuristic):
     """ Generic A-Star algorithm.
 
-        get_neighbors: function to explore a point's neighbors
-        start_position: Point
-        goal_test: function(Point) determines when to stop
-        heuristic: function(Points) determines how close it is (distance)
+        get_neighbors: function to explore a node's neighbors
+        start_position: node (Point or square number)
+        goal_test: function(node) determines when to stop
+        heuristic: function(node) determines how close it is (distance)
 
         return: shortest path length to goal or -1 if impossible
     """
@@ -20,6 +20,9 @@ def a_star(get_neighbors, start_position, goal_test, heuristic):
     while len(pq) > 0:
         # pop is based off tuple[0]
         search_state = heapq.heappop(pq)
+        # the same node can be queued more than once, only the first (shortest) one needs expanding
+        if search_state[1] in explored:
+            continue
         explored.add(search_state[1])
         
         if goal_test(search_state[1]):
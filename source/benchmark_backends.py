@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+
+from actions import StaticActions
+from model_backends import BACKENDS, create_session, create_model
+from state import State
+
+import constants
+
+
+BENCHMARK_SECONDS = 2.0
+
+
+
+def calls_per_second(function):
+    """ how many times function runs in a second, timed over BENCHMARK_SECONDS """
+    function()
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < BENCHMARK_SECONDS:
+        function()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+
+def benchmark(model, num_states, num_actions):
+    """ calls per second of what training and playing ask the model for """
+    batch_size = constants.BATCH_SIZE
+    states = np.random.randint(0, 2, (batch_size, num_states)).astype(np.float32)
+    next_states = np.random.randint(0, 2, (batch_size, num_states)).astype(np.float32)
+    actions = np.random.randint(0, num_actions, batch_size)
+    rewards = np.full(batch_size, constants.REWARD_BEING_ALIVE, dtype=np.float32)
+    dones = np.zeros(batch_size, dtype=np.float32)
+    legal_masks = np.random.rand(batch_size, num_actions) < 0.5
+
+    return {'predict_one': calls_per_second(lambda: model.predict_one(states[0])),
+            'predict_greedy': calls_per_second(lambda: model.predict_greedy(states, legal_masks)),
+            'train_q_batch': calls_per_second(lambda: model.train_q_batch(states, actions, rewards, next_states, dones))}
+
+
+
+def main():
+    """ Times every backend on random states the size of the real ones, use it to pick constants.MODEL_BACKEND """
+    static_actions = StaticActions(constants.BOARD_SIZE)
+    num_states = State(static_actions).vector_state_size
+    num_actions = len(static_actions.all_actions)
+
+    print("batch size", constants.BATCH_SIZE, ", calls per second:")
+    for backend in BACKENDS:
+        try:
+            session = create_session(backend)
+        except ImportError as error:
+            print(backend, "skipped,", error)
+            continue
+        with session as sess:
+            model = create_model(num_states, num_actions, sess, backend)
+            results = benchmark(model, num_states, num_actions)
+        print(backend, ", ".join("{} {:.0f}".format(name, rate) for name, rate in results.items()))
+
+
+
+if __name__ == '__main__':
+    main()
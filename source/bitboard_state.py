@@ -0,0 +1,544 @@
+from collections import OrderedDict
+import numpy as np
+
+from point import Point
+import constants
+from actions import StaticActions, MoveAction
+from constants import BoardElement
+
+from state import State
+from encoder import PerspectiveEncoder
+import zobrist
+
+
+# squares are numbered y * BOARD_SIZE + x so that a whole board fits in one python int
+BOARD_SIZE = constants.BOARD_SIZE
+WALL_GRID_SIZE = constants.BOARD_SIZE - 1
+NUM_SQUARES = BOARD_SIZE * BOARD_SIZE
+
+# direction indexes line up with the first four StaticActions.move_actions: (1,0), (-1,0), (0,1), (0,-1)
+RIGHT, LEFT, DOWN, UP = 0, 1, 2, 3
+DIRECTION_OFFSETS = (1, -1, BOARD_SIZE, -BOARD_SIZE)
+
+# MoveAction.direction (as a tuple) -> (direction index, number of squares travelled)
+MOVE_DIRECTIONS = {
+    (1, 0): (RIGHT, 1), (-1, 0): (LEFT, 1), (0, 1): (DOWN, 1), (0, -1): (UP, 1),
+    (2, 0): (RIGHT, 2), (-2, 0): (LEFT, 2), (0, 2): (DOWN, 2), (0, -2): (UP, 2),
+}
+
+
+def square_of(x, y):
+    return y * BOARD_SIZE + x
+
+
+def wall_bit(x, y):
+    """ walls are numbered x * WALL_GRID_SIZE + y to mirror State.walls[x][y] """
+    return 1 << (x * WALL_GRID_SIZE + y)
+
+
+def row_mask(y):
+    return ((1 << BOARD_SIZE) - 1) << (y * BOARD_SIZE)
+
+
+def build_open_edges():
+    """ For each direction, a mask of the squares that can step that way on an empty board
+        (the board edges are the only things in the way) """
+    open_edges = [0, 0, 0, 0]
+    for y in range(BOARD_SIZE):
+        for x in range(BOARD_SIZE):
+            bit = 1 << square_of(x, y)
+            if x < BOARD_SIZE - 1:
+                open_edges[RIGHT] |= bit
+            if x > 0:
+                open_edges[LEFT] |= bit
+            if y < BOARD_SIZE - 1:
+                open_edges[DOWN] |= bit
+            if y > 0:
+                open_edges[UP] |= bit
+    return tuple(open_edges)
+
+
+def build_wall_edges():
+    """ For every wall slot and orientation, the edge bits that the wall closes in each direction.
+        A horizontal wall at (x, y) sits between rows y and y+1 under columns x and x+1,
+        a vertical wall at (x, y) sits between columns x and x+1 beside rows y and y+1 """
+    wall_edges = {BoardElement.WALL_HORIZONTAL: {}, BoardElement.WALL_VERTICAL: {}}
+    for x in range(WALL_GRID_SIZE):
+        for y in range(WALL_GRID_SIZE):
+            top_left = 1 << square_of(x, y)
+            top_right = 1 << square_of(x + 1, y)
+            bot_left = 1 << square_of(x, y + 1)
+            bot_right = 1 << square_of(x + 1, y + 1)
+
+            horizontal = [0, 0, 0, 0]
+            horizontal[DOWN] = top_left | top_right
+            horizontal[UP] = bot_left | bot_right
+            wall_edges[BoardElement.WALL_HORIZONTAL][(x, y)] = tuple(horizontal)
+
+            vertical = [0, 0, 0, 0]
+            vertical[RIGHT] = top_left | bot_left
+            vertical[LEFT] = top_right | bot_right
+            wall_edges[BoardElement.WALL_VERTICAL][(x, y)] = tuple(vertical)
+    return wall_edges
+
+
+def build_wall_edge_pairs():
+    """ For every wall slot and orientation, the two pairs of neighboring squares the wall separates """
+    wall_edge_pairs = {BoardElement.WALL_HORIZONTAL: {}, BoardElement.WALL_VERTICAL: {}}
+    for x in range(WALL_GRID_SIZE):
+        for y in range(WALL_GRID_SIZE):
+            wall_edge_pairs[BoardElement.WALL_HORIZONTAL][(x, y)] = ((square_of(x, y), square_of(x, y + 1)), (square_of(x + 1, y), square_of(x + 1, y + 1)))
+            wall_edge_pairs[BoardElement.WALL_VERTICAL][(x, y)] = ((square_of(x, y), square_of(x + 1, y)), (square_of(x, y + 1), square_of(x + 1, y + 1)))
+    return wall_edge_pairs
+
+
+EMPTY_BOARD_OPEN_EDGES = build_open_edges()
+WALL_EDGES = build_wall_edges()
+WALL_EDGE_PAIRS = build_wall_edge_pairs()
+
+
+def neighbor_squares(open_edges, square):
+    """ the squares one open step away from square, in direction order """
+    return tuple(square + DIRECTION_OFFSETS[direction] for direction in range(4) if (open_edges[direction] >> square) & 1)
+
+
+EMPTY_BOARD_NEIGHBOR_TABLE = tuple(neighbor_squares(EMPTY_BOARD_OPEN_EDGES, square) for square in range(NUM_SQUARES))
+
+
+
+def pack_edges(edges):
+    """ lays the four per-direction masks side by side in one int so that two sets of edges
+        can be compared with a single & """
+    packed = 0
+    for direction in range(4):
+        packed |= edges[direction] << (direction * NUM_SQUARES)
+    return packed
+
+
+# (direction index, squares travelled) for each StaticActions.move_actions entry, in order
+MOVE_ACTION_TABLE = tuple(MOVE_DIRECTIONS[(action.direction.X, action.direction.Y)] for action in StaticActions(BOARD_SIZE).move_actions)
+
+# (wall slot bit, orientation, wall slot, packed closed edges) for each StaticActions.wall_actions entry, in order
+WALL_ACTION_TABLE = tuple(
+    (wall_bit(action.position.X, action.position.Y),
+     action.orientation,
+     (action.position.X, action.position.Y),
+     pack_edges(WALL_EDGES[action.orientation][(action.position.X, action.position.Y)]))
+    for action in StaticActions(BOARD_SIZE).wall_actions)
+
+
+
+UNREACHABLE = -1
+
+def compute_distance_field(open_edges, goal_mask):
+    """ Breadth first search backwards from the whole goal row at once, one ring of squares per loop.
+        Returns a tuple with every square's shortest path length to the goal row (UNREACHABLE if boxed in).
+        Pawns are not obstacles here, they move out of the way, walls don't """
+    right, left, down, up = open_edges
+    distances = [UNREACHABLE] * NUM_SQUARES
+
+    reached = goal_mask
+    frontier = goal_mask
+    distance = 0
+    while frontier:
+        squares = frontier
+        while squares:
+            lowest_bit = squares & -squares
+            distances[lowest_bit.bit_length() - 1] = distance
+            squares ^= lowest_bit
+
+        # edges are two way, so the squares that can step into the frontier are the frontier's open neighbors
+        ring = ((frontier & right) << 1) | ((frontier & left) >> 1) | ((frontier & down) << BOARD_SIZE) | ((frontier & up) >> BOARD_SIZE)
+        frontier = ring & ~reached
+        reached |= frontier
+        distance += 1
+
+    return tuple(distances)
+
+
+
+class DistanceFieldCache:
+    """ Least recently used cache of distance fields, keyed by wall layout and goal row.
+        The same few wall layouts come up over and over in self-play, so most lookups never search at all """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.fields = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, horizontal_walls, vertical_walls, goal_mask, open_edges):
+        """ cached distance field for this layout, computed from open_edges on a miss """
+        key = (horizontal_walls, vertical_walls, goal_mask)
+        field = self.fields.get(key)
+        if field is None:
+            self.misses += 1
+            field = compute_distance_field(open_edges, goal_mask)
+            self.put(horizontal_walls, vertical_walls, goal_mask, field)
+        else:
+            self.hits += 1
+            self.fields.move_to_end(key)
+        return field
+
+
+    def put(self, horizontal_walls, vertical_walls, goal_mask, field):
+        """ stores a field, evicting the least recently used one if the cache is full """
+        key = (horizontal_walls, vertical_walls, goal_mask)
+        self.fields[key] = field
+        self.fields.move_to_end(key)
+        if len(self.fields) > self.max_size:
+            self.fields.popitem(last=False)
+
+
+# shared by every BitboardState, layouts repeat across games as well as within them
+DISTANCE_FIELDS = DistanceFieldCache(constants.DISTANCE_FIELD_CACHE_SIZE)
+
+
+
+
+class BitboardState(State):
+    """ Drop in replacement for State that stores walls as integer bitmasks and pawns as square indexes.
+        Movement is precomputed as four "open edge" masks (one per direction) so that legality checks
+        are a couple of bit tests. Instead of searching for a path, every square's distance to each goal row
+        is kept in a cached distance field, so path checks are a single lookup at the pawn's square.
+        The rules are exactly the same as State's.
+    """
+
+
+    def __init__(self, static_actions):
+        # bit x * (BOARD_SIZE - 1) + y is set if that wall slot holds a wall of this orientation
+        self.horizontal_walls = 0
+        self.vertical_walls = 0
+        self.open_edges = list(EMPTY_BOARD_OPEN_EDGES)
+
+        self.wall_counts = {BoardElement.AGENT_TOP: constants.NUM_WALLS, BoardElement.AGENT_BOT: constants.NUM_WALLS}
+        self.pawns = {
+            BoardElement.AGENT_TOP: square_of(BOARD_SIZE // 2, 0),
+            BoardElement.AGENT_BOT: square_of(BOARD_SIZE // 2, BOARD_SIZE - 1),
+        }
+
+        self.agent_goals = {BoardElement.AGENT_TOP: BOARD_SIZE - 1, BoardElement.AGENT_BOT: 0}
+        self.goal_masks = {name: row_mask(row) for name, row in self.agent_goals.items()}
+
+        # distance_fields[agent_name][square] = shortest path length from square to agent_name's goal row
+        self.distance_fields = {name: DISTANCE_FIELDS.get(0, 0, goal_mask, self.open_edges) for name, goal_mask in self.goal_masks.items()}
+
+        self.static_actions = static_actions
+        self.winner = None
+
+        self.full_grid_size = BOARD_SIZE * 2 - 1
+        self.vector_state_size = (self.full_grid_size ** 2) + 2
+
+        self.zobrist_hash = zobrist.full_hash(self)
+        self.undo_stack = []
+        self.neighbor_table = list(EMPTY_BOARD_NEIGHBOR_TABLE)
+        self.encoder = PerspectiveEncoder()
+
+
+
+    @property
+    def agent_positions(self):
+        """ pawn squares as Points, for the display and the human player """
+        return {name: Point(square % BOARD_SIZE, square // BOARD_SIZE) for name, square in self.pawns.items()}
+
+
+    @property
+    def walls(self):
+        """ walls rebuilt in State's [x][y] list layout, for the display """
+        walls = [[BoardElement.EMPTY for y in range(WALL_GRID_SIZE)] for x in range(WALL_GRID_SIZE)]
+        for x in range(WALL_GRID_SIZE):
+            for y in range(WALL_GRID_SIZE):
+                walls[x][y] = self.get_wall(Point(x, y))
+        return walls
+
+
+
+    def is_legal_action(self, action, agent_name):
+        """ checks whether this action by this agent is legal or not."""
+        if isinstance(action, MoveAction):
+            direction = action.direction
+            direction_and_distance = MOVE_DIRECTIONS.get((direction.X, direction.Y))
+            if direction_and_distance is None:
+                return False
+            return self.legal_move_from_square(self.pawns[agent_name], *direction_and_distance)
+        else:
+            return self.legal_wall_placement(agent_name, action)
+
+
+    def legal_action_mask(self, agent_name):
+        """ Every action's legality in one pass. Moves are bit tests, walls are a couple of distance
+            field lookups (see distance_fields_with_wall) """
+        mask = np.zeros(len(MOVE_ACTION_TABLE) + len(WALL_ACTION_TABLE), dtype=bool)
+
+        square = self.pawns[agent_name]
+        for index, (direction, distance) in enumerate(MOVE_ACTION_TABLE):
+            mask[index] = self.legal_move_from_square(square, direction, distance)
+
+        if self.wall_counts[agent_name] == 0:
+            return mask
+
+        occupied = self.horizontal_walls | self.vertical_walls
+        open_packed = pack_edges(self.open_edges)
+
+        for index, (bit, orientation, slot, closed_packed) in enumerate(WALL_ACTION_TABLE, len(MOVE_ACTION_TABLE)):
+            # slot taken, or shares an edge with a wall of the same orientation
+            if occupied & bit or closed_packed & ~open_packed:
+                continue
+            mask[index] = self.wall_keeps_paths(orientation, slot)
+
+        return mask
+
+
+
+    def legal_move(self, position, move_action):
+        """ Same rules as State.legal_move, done with bit tests on the open edge masks """
+        direction = move_action.direction
+        direction_and_distance = MOVE_DIRECTIONS.get((direction.X, direction.Y))
+        if direction_and_distance is None:
+            return False
+
+        # positions off the board can't move anywhere
+        if position.X < 0 or position.X >= BOARD_SIZE or position.Y < 0 or position.Y >= BOARD_SIZE:
+            return False
+        return self.legal_move_from_square(square_of(position.X, position.Y), *direction_and_distance)
+
+
+    def legal_move_from_square(self, square, direction, distance):
+        """ A step needs an open edge and an empty square, a jump needs two open edges and a pawn in between """
+        open_edges = self.open_edges[direction]
+        if not (open_edges >> square) & 1:
+            return False
+
+        next_square = square + DIRECTION_OFFSETS[direction]
+        next_is_pawn = next_square == self.pawns[BoardElement.AGENT_TOP] or next_square == self.pawns[BoardElement.AGENT_BOT]
+        if distance == 1:
+            return not next_is_pawn
+        return next_is_pawn and bool((open_edges >> next_square) & 1)
+
+
+
+    def pawn_square(self, agent_name):
+        """ this agent's square number """
+        return self.pawns[agent_name]
+
+
+    def open_neighbor_squares(self, square):
+        """ the neighbor_table entry for this square, read off the open edge masks """
+        return neighbor_squares(self.open_edges, square)
+
+
+
+    def get_wall(self, position):
+        """ Helper function that returns the wall type at this position"""
+        bit = wall_bit(position.X, position.Y)
+        if self.horizontal_walls & bit:
+            return BoardElement.WALL_HORIZONTAL
+        if self.vertical_walls & bit:
+            return BoardElement.WALL_VERTICAL
+        return BoardElement.EMPTY
+
+
+    def legal_wall_placement(self, agent_name, wall_action):
+        """ Same rules as State.legal_wall_placement. The wall is never actually placed,
+            the path check runs on a copy of the open edge masks with the wall's edges closed """
+        position = wall_action.position
+        orientation = wall_action.orientation
+
+        if self.wall_counts[agent_name] == 0:
+            return False
+
+        if (self.horizontal_walls | self.vertical_walls) & wall_bit(position.X, position.Y):
+            return False
+
+        # walls of the same orientation can't share an edge, which is what partial overlap means
+        closed_edges = WALL_EDGES[orientation][(position.X, position.Y)]
+        for direction in range(4):
+            if closed_edges[direction] & ~self.open_edges[direction]:
+                return False
+
+        return self.wall_keeps_paths(orientation, (position.X, position.Y))
+
+
+    def wall_keeps_paths(self, orientation, slot):
+        """ True if both agents could still reach their goal rows with this wall placed """
+        fields = self.distance_fields_with_wall(orientation, slot)
+        for name, square in self.pawns.items():
+            if fields[name][square] == UNREACHABLE:
+                return False
+        return True
+
+
+    def distance_fields_with_wall(self, orientation, slot):
+        """ The distance fields as they would be with this wall placed, without placing it.
+            A wall can only change a field if it separates two squares at different distances (an edge
+            that shortest paths run through). Otherwise the current field is still exact and is reused,
+            which is most walls. The rest are looked up in (or computed into) the cache """
+        (first, first_neighbor), (second, second_neighbor) = WALL_EDGE_PAIRS[orientation][slot]
+
+        fields = {}
+        open_edges = None
+        for name, field in self.distance_fields.items():
+            if field[first] == field[first_neighbor] and field[second] == field[second_neighbor]:
+                fields[name] = field
+                continue
+
+            if open_edges is None:
+                closed_edges = WALL_EDGES[orientation][slot]
+                open_edges = [self.open_edges[direction] & ~closed_edges[direction] for direction in range(4)]
+                horizontal_walls, vertical_walls = self.horizontal_walls, self.vertical_walls
+                if orientation == BoardElement.WALL_HORIZONTAL:
+                    horizontal_walls |= wall_bit(*slot)
+                else:
+                    vertical_walls |= wall_bit(*slot)
+            fields[name] = DISTANCE_FIELDS.get(horizontal_walls, vertical_walls, self.goal_masks[name], open_edges)
+        return fields
+
+
+
+    def place_wall(self, position, orientation, agent_name):
+        """ Places a wall from agent_name of orientation at this position, updating the distance fields incrementally"""
+        slot = (position.X, position.Y)
+        self.distance_fields = self.distance_fields_with_wall(orientation, slot)
+
+        if orientation == BoardElement.WALL_HORIZONTAL:
+            self.horizontal_walls |= wall_bit(*slot)
+        else:
+            self.vertical_walls |= wall_bit(*slot)
+
+        closed_edges = WALL_EDGES[orientation][slot]
+        for direction in range(4):
+            self.open_edges[direction] &= ~closed_edges[direction]
+        self.encoder.place_wall(position.X, position.Y, orientation)
+
+        wall_count_keys = zobrist.WALL_COUNT_KEYS[agent_name]
+        self.zobrist_hash ^= zobrist.WALL_KEYS[orientation][slot[0] * WALL_GRID_SIZE + slot[1]] ^ wall_count_keys[self.wall_counts[agent_name]]
+        self.wall_counts[agent_name] -= 1
+        self.zobrist_hash ^= wall_count_keys[self.wall_counts[agent_name]]
+        self.refresh_neighbor_table(position)
+
+        # reused fields weren't cached under the new layout yet
+        for name, field in self.distance_fields.items():
+            DISTANCE_FIELDS.put(self.horizontal_walls, self.vertical_walls, self.goal_masks[name], field)
+
+
+    def remove_wall(self, position, agent_name):
+        """ Removes this wall at this position and refunds it to agent_name.
+            Legal walls never share an edge, so reopening this wall's edges can't open someone else's """
+        orientation = self.get_wall(position)
+        bit = wall_bit(position.X, position.Y)
+        self.horizontal_walls &= ~bit
+        self.vertical_walls &= ~bit
+
+        closed_edges = WALL_EDGES[orientation][(position.X, position.Y)]
+        for direction in range(4):
+            self.open_edges[direction] |= closed_edges[direction]
+        self.encoder.remove_wall(position.X, position.Y, orientation)
+
+        wall_count_keys = zobrist.WALL_COUNT_KEYS[agent_name]
+        self.zobrist_hash ^= zobrist.WALL_KEYS[orientation][position.X * WALL_GRID_SIZE + position.Y] ^ wall_count_keys[self.wall_counts[agent_name]]
+        self.wall_counts[agent_name] += 1
+        self.zobrist_hash ^= wall_count_keys[self.wall_counts[agent_name]]
+        self.refresh_neighbor_table(position)
+
+        self.distance_fields = {name: DISTANCE_FIELDS.get(self.horizontal_walls, self.vertical_walls, goal_mask, self.open_edges)
+                                for name, goal_mask in self.goal_masks.items()}
+
+
+
+    def distance_to_goal(self, agent_name):
+        """ Shortest path length from the agent to its goal row, or UNREACHABLE """
+        return self.distance_fields[agent_name][self.pawns[agent_name]]
+
+
+    def distance_field(self, agent_name):
+        """ the cached distance field itself, already kept up to date """
+        return self.distance_fields[agent_name]
+
+
+    def path_to_goal_exists(self, agent_name):
+        """ O(1) lookup of the agent's square in its distance field """
+        return self.distance_to_goal(agent_name) != UNREACHABLE
+
+
+
+    def push(self, legal_action, agent_name):
+        """ apply_action() that remembers how to undo itself, see pop().
+            Returns the reward, just like apply_action """
+        if isinstance(legal_action, MoveAction):
+            undo = (agent_name, self.pawns[agent_name], None, None, self.winner, self.zobrist_hash, None)
+        else:
+            position = legal_action.position
+            undo = (agent_name, None, (position.X, position.Y), legal_action.orientation, self.winner, self.zobrist_hash, self.distance_fields)
+        self.undo_stack.append(undo)
+        return self.apply_action(agent_name, legal_action)
+
+
+    def pop(self):
+        """ Undoes the most recent push(). Walls are taken back by hand rather than with remove_wall()
+            because the old distance fields are in the undo record, no cache lookup needed """
+        agent_name, square, slot, orientation, winner, zobrist_hash, distance_fields = self.undo_stack.pop()
+        if slot is None:
+            self.pawns[agent_name] = square
+        else:
+            bit = wall_bit(*slot)
+            self.horizontal_walls &= ~bit
+            self.vertical_walls &= ~bit
+
+            closed_edges = WALL_EDGES[orientation][slot]
+            for direction in range(4):
+                self.open_edges[direction] |= closed_edges[direction]
+            self.encoder.remove_wall(slot[0], slot[1], orientation)
+            self.wall_counts[agent_name] += 1
+            self.distance_fields = distance_fields
+            self.refresh_neighbor_table(Point(*slot))
+
+        self.winner = winner
+        self.zobrist_hash = zobrist_hash
+
+
+
+    def apply_move_action(self, agent_name, move_action):
+        """ Takes a valid move action from agent_name and updates the state accordingly"""
+        direction = move_action.direction
+        previous_square = self.pawns[agent_name]
+        square = previous_square + direction.X + direction.Y * BOARD_SIZE
+        self.pawns[agent_name] = square
+
+        pawn_keys = zobrist.PAWN_KEYS[agent_name]
+        self.zobrist_hash ^= pawn_keys[previous_square] ^ pawn_keys[square]
+
+        if square // BOARD_SIZE == self.agent_goals[agent_name]:
+            self.winner = agent_name
+            return constants.REWARD_WIN
+
+        return constants.REWARD_BEING_ALIVE
+
+
+
+    def build_grid(self, current_agent, enemy_agent):
+        """ Same grid as State.build_grid, only visiting the walls that are actually set """
+        grid = [[BoardElement.EMPTY for y in range(self.full_grid_size)] for x in range(self.full_grid_size)]
+
+        for walls, orientation in ((self.horizontal_walls, BoardElement.WALL_HORIZONTAL), (self.vertical_walls, BoardElement.WALL_VERTICAL)):
+            while walls:
+                lowest_bit = walls & -walls
+                index = lowest_bit.bit_length() - 1
+                walls ^= lowest_bit
+
+                grid_x = 2 * (index // WALL_GRID_SIZE) + 1
+                grid_y = 2 * (index % WALL_GRID_SIZE) + 1
+                grid[grid_x][grid_y] = BoardElement.WALL
+                if orientation == BoardElement.WALL_HORIZONTAL:
+                    grid[grid_x - 1][grid_y] = BoardElement.WALL
+                    grid[grid_x + 1][grid_y] = BoardElement.WALL
+                else:
+                    grid[grid_x][grid_y - 1] = BoardElement.WALL
+                    grid[grid_x][grid_y + 1] = BoardElement.WALL
+
+        agent_square = self.pawns[current_agent]
+        grid[(agent_square % BOARD_SIZE) * 2][(agent_square // BOARD_SIZE) * 2] = BoardElement.SELF_AGENT
+
+        enemy_square = self.pawns[enemy_agent]
+        grid[(enemy_square % BOARD_SIZE) * 2][(enemy_square // BOARD_SIZE) * 2] = BoardElement.ENEMY_AGENT
+
+        return grid
@@ -0,0 +1,176 @@
+import os
+import glob
+import queue
+import threading
+
+import numpy as np
+
+import constants
+
+
+
+CHECKPOINT_PREFIX = 'checkpoint_'
+
+
+
+class Checkpointer:
+    """ Saves training so it can pick up again after a crash or a restart, without stalling the games.
+
+        save() only copies what's needed into memory: every model variable (the optimizer's included), each
+        agent's exploration progress and its memory's cursor (and the memory itself when it lives in RAM,
+        replay files already survive on their own). A background thread writes that snapshot to a
+        temporary file and renames it into place, so a checkpoint on disk is always complete, and deletes
+        all but the newest CHECKPOINTS_KEPT. At most one snapshot waits for the writer, a newer one replaces
+        it, so a slow disk costs checkpoints rather than memory. restore_latest() loads the newest one back.
+
+        Only cheap on the training thread with REPLAY_MEMORY_FOLDER set: with the memories in RAM every save()
+        copies all of them there and then, MEMORY_SIZE * 2 state vectors per agent
+    """
+    def __init__(self, model, agents=None, folder=constants.CHECKPOINT_FOLDER, kept=constants.CHECKPOINTS_KEPT):
+        self.model = model
+        self.agents = agents if agents is not None else {}
+        self.folder = folder
+        self.kept = kept
+
+        # a snapshot can hold the whole replay memory, so only ever keep one waiting
+        self.snapshots = queue.Queue(maxsize=1)
+        self.writer = None
+        # the last thing that went wrong writing a checkpoint, raised on the training thread by the next save() or close()
+        self.error = None
+        # checkpoints are numbered in the order they're saved, carrying on from any already in the folder
+        self.next_number = None
+
+
+    def snapshot(self, games):
+        """ everything a checkpoint holds, copied out of the model and agents as numpy arrays """
+        arrays = {'games': games}
+        for index, (name, value) in enumerate(self.model.get_variables()):
+            arrays['variable_name_' + str(index)] = name
+            arrays['variable_' + str(index)] = value
+        for name, agent in self.agents.items():
+            prefix = 'agent_' + name + '_'
+            arrays[prefix + 'steps'] = agent.steps
+            arrays[prefix + 'exploration_probability'] = agent.exploration_probability
+            for key, value in agent.memory.get_state().items():
+                arrays[prefix + 'memory_' + key] = value
+        return arrays
+
+
+    def save(self, games):
+        """ snapshots now, writes later on the background thread. Replaces any snapshot the writer hasn't got to yet """
+        self.raise_error()
+        if self.writer is None:
+            os.makedirs(self.folder, exist_ok=True)
+            self.writer = threading.Thread(target=self.write_snapshots, daemon=True)
+            self.writer.start()
+        if self.next_number is None:
+            checkpoints = self.checkpoints()
+            self.next_number = self.checkpoint_number(checkpoints[-1]) + 1 if checkpoints else 0
+
+        # drop the one still waiting before copying another, only this thread puts so the put won't block
+        try:
+            self.snapshots.get_nowait()
+        except queue.Empty:
+            pass
+        self.snapshots.put((self.next_number, self.snapshot(games)))
+        self.next_number += 1
+
+
+    def write_snapshots(self):
+        # a crash halfway through writing leaves its temporary file behind
+        try:
+            for temporary_path in glob.glob(os.path.join(self.folder, CHECKPOINT_PREFIX + '*.npz.tmp')):
+                os.remove(temporary_path)
+        except OSError as error:
+            self.error = error
+
+        while True:
+            snapshot = self.snapshots.get()
+            if snapshot is None:
+                return
+            # a full disk or the like mustn't kill the thread, save() would go on queueing for nobody
+            try:
+                self.write_snapshot(*snapshot)
+            except Exception as error:
+                self.error = error
+
+
+    def write_snapshot(self, number, arrays):
+        path = os.path.join(self.folder, CHECKPOINT_PREFIX + '{:010d}.npz'.format(number))
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as checkpoint_file:
+            np.savez(checkpoint_file, **arrays)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, path)
+
+        for old_path in self.checkpoints()[:-self.kept]:
+            os.remove(old_path)
+        print("saved to ", path)
+
+
+    def raise_error(self):
+        """ raises what went wrong on the writer thread since the last time, if anything did """
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+
+    def close(self):
+        """ waits for the snapshot still queued to be written """
+        if self.writer is not None:
+            if self.writer.is_alive():
+                self.snapshots.put(None)
+                self.writer.join()
+            else:
+                # nobody left to write it
+                try:
+                    self.snapshots.get_nowait()
+                except queue.Empty:
+                    pass
+            self.writer = None
+        self.raise_error()
+
+
+    def checkpoints(self):
+        """ complete checkpoint files, oldest first """
+        return sorted(glob.glob(os.path.join(self.folder, CHECKPOINT_PREFIX + '*.npz')), key=self.checkpoint_number)
+
+
+    def checkpoint_number(self, path):
+        return int(os.path.basename(path)[len(CHECKPOINT_PREFIX):-len('.npz')])
+
+
+    def resume(self):
+        """ restore_latest(), falling back on the model's own save from before there were checkpoints.
+            Returns how many games had been played """
+        games = self.restore_latest()
+        if games is None:
+            self.model.load()
+            return 0
+        return games
+
+
+    def restore_latest(self):
+        """ Restores the newest checkpoint, returns how many games had been played when it was saved
+            or None if there is no checkpoint """
+        checkpoints = self.checkpoints()
+        if not checkpoints:
+            return None
+
+        with np.load(checkpoints[-1]) as arrays:
+            num_variables = len([key for key in arrays.files if key.startswith('variable_name_')])
+            self.model.set_variables([(str(arrays['variable_name_' + str(index)]), arrays['variable_' + str(index)])
+                                      for index in range(num_variables)])
+
+            for name, agent in self.agents.items():
+                prefix = 'agent_' + name + '_'
+                if prefix + 'steps' not in arrays.files:
+                    continue
+                agent.steps = int(arrays[prefix + 'steps'])
+                agent.exploration_probability = float(arrays[prefix + 'exploration_probability'])
+                memory_prefix = prefix + 'memory_'
+                agent.memory.set_state({key[len(memory_prefix):]: arrays[key] for key in arrays.files if key.startswith(memory_prefix)})
+
+            print("restored from ", checkpoints[-1])
+            return int(arrays['games'])
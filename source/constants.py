@@ -3,6 +3,15 @@
 # SIZE OF THE GAME
 BOARD_SIZE = 4                          # board size (less complexity)
 NUM_WALLS = 2                           # number of walls each player starts with
+USE_BITBOARD_STATE = True               # bitboard_state.BitboardState (fast) instead of state.State (reference implementation)
+DISTANCE_FIELD_CACHE_SIZE = 20000       # number of (wall layout, goal row) distance fields the bitboard state remembers
+USE_TRANSPOSITION_TABLE = True          # memoize legal actions and q values of positions that were already seen
+TRANSPOSITION_TABLE_SIZE = 100000       # max number of (position, perspective) entries kept
+NUM_PARALLEL_GAMES = 1                  # more than 1 trains on that many games at once with vectorized_game.VectorizedQuoridor (no display)
+NUM_ACTORS = 4                          # processes playing self-play games for the one learner when training with actor_pool.py
+ACTOR_CHUNK_SIZE = 32                   # transitions an actor collects before sending them, the learner trains each agent once per chunk
+WEIGHT_BROADCAST_FREQUENCY = 50         # learner training steps between sending the actors new weights
+ACTOR_MODEL_BACKEND = 'numpy'           # actors only predict, see MODEL_BACKEND
 
 
 # PROGRAM PURPOSE
@@ -11,20 +20,45 @@ NUM_WALLS = 2                           # number of walls each player starts wit
 DISPLAY_GAME = True                     # false to avoid pygame altogether
 INITIALLY_HUMAN_PLAYING = False         # ultimate test of intelligence
 INITIALLY_USING_ONLY_INFERENCE = False
-RESTORE = False                         # signifies if agent should be loaded from tensorflow checkpoint (from disc)
+RESTORE = False                         # signifies if training should resume from the latest checkpoint (or the older tensorflow checkpoint if there are none)
+CHECKPOINT_FOLDER = 'checkpoints'       # where training is checkpointed every PRINT_UPDATE_FREQUENCY games
+CHECKPOINTS_KEPT = 5                    # older checkpoints are deleted
+POLICY_FILE = 'policy.npz'              # trained weights exported by export_policy.py for play.py
+QUANTIZATION_REPORT_POSITIONS = 5000    # random positions quantized_policy.py compares the quantized and float policies on
+INFERENCE_SERVER_HOST = '127.0.0.1'     # where inference_server.py serves games against the exported policy
+INFERENCE_SERVER_PORT = 5555
+INFERENCE_MAX_BATCH_SIZE = 64           # most predictions the inference server runs through the model at once
+INFERENCE_BATCH_WINDOW_SECONDS = 0.002  # how long a batch waits for more games' predictions before it runs
+INFERENCE_MAX_GAME_LENGTH = 1000        # AI vs AI games longer than this are abandoned
+SEARCH_TIME_SECONDS = 0.1               # time budget per move of search_agent.py's alpha-beta agents
+SEARCH_MAX_DEPTH = 12                   # plies, iterative deepening stops here even with time left
+SEARCH_EVALUATION_GAMES = 100           # games search_agent.py plays against the exported policy
+MCTS_THREADS = 4                        # worker threads of mcts_agent.py's searches, which also get SEARCH_TIME_SECONDS per move
+MCTS_LEAF_BATCH_SIZE = 16               # leaves each MCTS worker collects for one predict_batch
+MCTS_POOL_SIZE = 200000                 # most nodes an MCTS tree can hold
 
 INITIAL_GAME_DELAY = 0                  # initial value for game_delay, which simply slows down the game so we can watch the agents plays ;)
 GAME_DELAY_SEONDS = 1                   # if game_delay is switched on, this is the delay used
 
 
 # TRAINING PARAMETERS
-NUM_GAMES = 1000
+NUM_GAMES = 1000                        # games to train for in total, a resumed run only plays the rest
 
 REWARD_WIN = 1.0                        # big bucks
 REWARD_BEING_ALIVE = -.04               # yikes
 
 MEMORY_SIZE = 500                       # max number of (s,a,s',r) samples to store for learning at once
+REPLAY_MEMORY_FOLDER = None             # folder to keep the memories in as files that last between runs (None keeps them in RAM,
+                                        # then every checkpoint copies the whole memory on the training thread)
 BATCH_SIZE = 50                         # how many actions from memory to learn from at a time
+MODEL_BACKEND = 'tensorflow'            # 'tensorflow' (model.Model) or 'numpy' (numpy_model.NumpyModel), see benchmark_backends.py
+
+USE_MIRROR_AUGMENTATION = False         # learn from about half of each batch mirrored left to right, twice the data from the same games
+USE_PRIORITIZED_REPLAY = False          # sample memories by how surprising they were (memory.PrioritizedMemory) instead of uniformly
+PRIORITY_ALPHA = 0.6                    # 0 is uniform sampling, 1 is fully proportional to the TD error
+PRIORITY_EPSILON = 0.01                 # keeps memories the model already gets right from never being sampled again
+PRIORITY_BETA_START = 0.4               # importance sampling correction strength at the start, grows to 1
+PRIORITY_BETA_STEPS = 100000            # batches sampled until the correction is at full strength
 
 MOVE_ACTION_PROBABILITY = .90           # training wheels to encorage the agents to move more often
 GAMMA = 0.80                            # future reward discount factor (bellman equation)
@@ -0,0 +1,78 @@
+import numpy as np
+
+import constants
+from constants import BoardElement
+
+
+
+def mirrored_state_indexes():
+    """ permutation of a state vector that mirrors the board left to right: every row of the grid reversed,
+        the wall counts left alone. Mirroring twice changes nothing, and it's the same for both perspectives """
+    full_grid_size = constants.BOARD_SIZE * 2 - 1
+    cells = np.arange(full_grid_size ** 2).reshape(full_grid_size, full_grid_size)
+    return np.concatenate([cells[:, ::-1].ravel(), np.arange(full_grid_size ** 2, full_grid_size ** 2 + 2)])
+
+
+
+class PerspectiveEncoder:
+    """ Builds the state vectors the NN sees without going through State.build_grid.
+
+        The walls part of the grid lives in one preallocated float32 array that the state updates
+        a wall at a time as walls are placed and removed. Encoding a perspective is then one copy of that
+        array into the output, two pawn writes and the two wall counts. TopAgent's perspective (the board
+        flipped on both axes) is just the same array read backwards, so no second grid is ever built.
+    """
+    def __init__(self):
+        self.full_grid_size = constants.BOARD_SIZE * 2 - 1
+        self.grid_cells = self.full_grid_size ** 2
+        self.vector_state_size = self.grid_cells + 2
+
+        # grid[y * full_grid_size + x], same order the agents have always flattened build_grid in
+        self.grid = np.full(self.grid_cells, BoardElement.EMPTY, dtype=np.float32)
+
+        # pawn_cells[square] = grid index of board square y * BOARD_SIZE + x
+        self.pawn_cells = [2 * (square // constants.BOARD_SIZE) * self.full_grid_size + 2 * (square % constants.BOARD_SIZE)
+                           for square in range(constants.BOARD_SIZE ** 2)]
+
+
+    def wall_cells(self, x, y, orientation):
+        """ the three grid indexes covered by the wall at wall slot (x, y) """
+        grid_x = 2 * x + 1
+        grid_y = 2 * y + 1
+        if orientation == BoardElement.WALL_HORIZONTAL:
+            return [grid_y * self.full_grid_size + grid_x + offset for offset in (-1, 0, 1)]
+        return [(grid_y + offset) * self.full_grid_size + grid_x for offset in (-1, 0, 1)]
+
+
+    def place_wall(self, x, y, orientation):
+        self.grid[self.wall_cells(x, y, orientation)] = BoardElement.WALL
+
+
+    def remove_wall(self, x, y, orientation):
+        # legal walls never share a grid cell, so clearing these can't erase part of another wall
+        self.grid[self.wall_cells(x, y, orientation)] = BoardElement.EMPTY
+
+
+    def encode(self, agent_square, enemy_square, agent_walls, enemy_walls, flipped, out=None):
+        """ Writes the state vector into out (a new float32 array if out is None) and returns it.
+            flipped reverses both axes of the grid, for TopAgent """
+        if out is None:
+            out = np.empty(self.vector_state_size, dtype=np.float32)
+
+        last_cell = self.grid_cells - 1
+        agent_cell = self.pawn_cells[agent_square]
+        enemy_cell = self.pawn_cells[enemy_square]
+        if flipped:
+            out[:self.grid_cells] = self.grid[::-1]
+            agent_cell = last_cell - agent_cell
+            enemy_cell = last_cell - enemy_cell
+        else:
+            out[:self.grid_cells] = self.grid
+
+        out[agent_cell] = BoardElement.SELF_AGENT
+        out[enemy_cell] = BoardElement.ENEMY_AGENT
+
+        # my walls, then enemy walls
+        out[self.grid_cells] = agent_walls
+        out[self.grid_cells + 1] = enemy_walls
+        return out
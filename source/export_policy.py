@@ -0,0 +1,25 @@
+from actions import StaticActions
+from model_backends import create_session, create_model
+from checkpoint import Checkpointer
+from state import State
+
+import constants
+
+
+
+def main():
+    """ Restores the trained model (of constants.MODEL_BACKEND) from its latest checkpoint and exports its weights to
+        constants.POLICY_FILE, which play.py runs with NumpyPolicy (no tensorflow needed there) """
+    static_actions = StaticActions(constants.BOARD_SIZE)
+    num_states = State(static_actions).vector_state_size
+
+    with create_session() as sess:
+        model = create_model(num_states, len(static_actions.all_actions), sess)
+        Checkpointer(model).resume()
+        model.export_policy(constants.POLICY_FILE)
+    print("exported to ", constants.POLICY_FILE)
+
+
+
+if __name__ == '__main__':
+    main()
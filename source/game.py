@@ -9,10 +9,11 @@ from memory import MemoryInstance
 from point import Point
 
 from actions import StaticActions, MoveAction, WallAction
-from model import Model
 from agents import TopAgent,  BottomAgent
 
-from state import State
+from checkpoint import Checkpointer
+from model_backends import create_model, selected_state_class
+from training_statistics import TrainingStatistics
 
 from display_game import DisplayGame
 
@@ -24,19 +25,22 @@ import pygame
 
 
 
-class QuoridorGame:
+class QuoridorGame(TrainingStatistics):
     """ Quoridor displays the game, runs the game actions, keeps track of the game state,
         and allows humans to play the machine.
     """
-    def __init__(self, sess):
+    def __init__(self, sess, model=None, backend=None):
         pygame.init()
 
         # static_actions is used by other objects to ensure consistency with our actions
         static_actions = StaticActions(constants.BOARD_SIZE)
         self.static_actions = static_actions
 
+        # both state classes follow the same rules, the bitboard one is just much faster
+        self.state_class = selected_state_class()
+
         # global board state
-        self.state = State(static_actions)
+        self.state = self.state_class(static_actions)
 
         # display_game draws the state to the screen
         if constants.DISPLAY_GAME:
@@ -46,9 +50,15 @@ class QuoridorGame:
         # model is passed to the agents as a reference to ensure both agents update
         # the same model object over the course of training
         print("Setting up agent networks...")
-        self.model = Model(self.state.vector_state_size, len(static_actions.all_actions), constants.BATCH_SIZE, constants.RESTORE, sess)
-        top_agent = TopAgent(sess, static_actions, self.model)
-        bottom_agent = BottomAgent(sess, static_actions, self.model)
+        # or any model passed in, like an exported NumpyPolicy to play against.
+        # otherwise a new one of the given backend (constants.MODEL_BACKEND by default), sess being what
+        # model_backends.create_session made for it
+        resuming = model is None and constants.RESTORE
+        if model is None:
+            model = create_model(self.state.vector_state_size, len(static_actions.all_actions), sess, backend)
+        self.model = model
+        top_agent = TopAgent(sess, static_actions, self.model, constants.REPLAY_MEMORY_FOLDER)
+        bottom_agent = BottomAgent(sess, static_actions, self.model, constants.REPLAY_MEMORY_FOLDER)
         print("completed\n")
 
         # will iterate through self.agents to create a turn bases system
@@ -64,12 +74,13 @@ class QuoridorGame:
         self.only_inference = constants.INITIALLY_USING_ONLY_INFERENCE
         self.human_playing = constants.INITIALLY_HUMAN_PLAYING
 
-        # statistics
-        self.sum_game_lengths = 0
-        self.games = 0
-        self.victories = {BoardElement.AGENT_TOP: 0, BoardElement.AGENT_BOT: 0}
+        self.reset_statistics()
+
+        # saves training in the background every print_details
+        self.checkpointer = Checkpointer(self.model, self.agents)
+        if resuming:
+            self.games = self.checkpointer.resume()
 
-        self.reward_sum = 0
         self.reset()
 
 
@@ -77,7 +88,7 @@ class QuoridorGame:
     def reset(self):
         """ reset state after each game """
         self.actions_taken = 0
-        self.state = State(self.static_actions)
+        self.state = self.state_class(self.static_actions)
         self.human_action = None
 
         # also reset the visuals
@@ -110,6 +121,7 @@ class QuoridorGame:
                 reward = agent.take_action(self.state, self.only_inference, self.human_action)
 
                 if reward == None: # 0 moves to make, so abandon this game
+                    self.abandoned_games += 1
                     game_over = True
                     break
                 
@@ -259,25 +271,3 @@ class QuoridorGame:
         wall_action = WallAction(Point(selected_wall_x, selected_wall_y), orientation)
 
         return wall_action
-
-
-
-
-
-    def print_details(self, games_per_epoch):
-        """ print details on recent statistics to see how training is coming along"""
-        self.model.save()
-
-        local_avg_game_length = self.sum_game_lengths / games_per_epoch
-        self.sum_game_lengths = 0
-
-        recent_reward_avg = self.reward_sum / games_per_epoch
-        self.reward_sum = 0
-
-        print("Top Victories: ", self.victories[BoardElement.AGENT_TOP])
-        print("Bot Victories: ", self.victories[BoardElement.AGENT_BOT])
-        print("Local Average Game Length: ", local_avg_game_length)
-        print("Local Average Game Reward: ", recent_reward_avg)
-
-        print("Local Average Loss: ", self.agents[BoardElement.AGENT_BOT].get_recent_loss())
-        print('exploration_probability', self.agents[BoardElement.AGENT_TOP].get_exploration_probability())
\ No newline at end of file
@@ -0,0 +1,131 @@
+import random
+
+from actions import StaticActions
+from model_backends import create_session, create_model, selected_state_class
+from agents import TopAgent, BottomAgent
+
+from vectorized_game import VectorizedQuoridor
+from training_statistics import TrainingStatistics
+from checkpoint import Checkpointer
+
+import constants
+from constants import BoardElement
+
+
+
+class HeadlessQuoridor(TrainingStatistics):
+    """ Self-play without the screen. QuoridorGame sets up pygame and polls its events after every ply
+        even when nothing is being drawn, this never imports it at all.
+
+        Self-play is exposed as a stream: transitions() plays games and yields every (S, A, R, S')
+        as it happens, train() is the usual training loop built on top of it.
+    """
+    def __init__(self, sess, backend=None):
+        static_actions = StaticActions(constants.BOARD_SIZE)
+        self.static_actions = static_actions
+
+        self.state_class = selected_state_class()
+        self.state = self.state_class(static_actions)
+
+        # same single model shared by both agents as in QuoridorGame, of the given backend (constants.MODEL_BACKEND by default)
+        self.model = create_model(self.state.vector_state_size, len(static_actions.all_actions), sess, backend)
+        top_agent = TopAgent(sess, static_actions, self.model, constants.REPLAY_MEMORY_FOLDER)
+        bottom_agent = BottomAgent(sess, static_actions, self.model, constants.REPLAY_MEMORY_FOLDER)
+        self.agents = {BoardElement.AGENT_BOT: bottom_agent, BoardElement.AGENT_TOP: top_agent}
+
+        self.only_inference = constants.INITIALLY_USING_ONLY_INFERENCE
+
+        self.reset_statistics()
+
+        # saves training in the background every print_details
+        self.checkpointer = Checkpointer(self.model, self.agents)
+        if constants.RESTORE:
+            self.games = self.checkpointer.resume()
+
+
+
+    def transitions(self, num_games=None):
+        """ Generator that plays num_games games (forever if None) and yields (agent_name, memory_instance)
+            for every action taken. memory_instance is the (S, A, R, S') MemoryInstance from that agent's
+            perspective, nothing is remembered or learned here, that's up to whoever consumes the stream
+        """
+        played = 0
+        while num_games is None or played < num_games:
+            self.state = self.state_class(self.static_actions)
+            actions_taken = 0
+
+            # first player
+            if random.random() > 0.5:
+                current_agent = BoardElement.AGENT_BOT
+            else:
+                current_agent = BoardElement.AGENT_TOP
+
+            while True:
+                agent = self.agents[current_agent]
+                memory_instance = agent.act(self.state, self.only_inference)
+                if memory_instance == None: # 0 moves to make, so abandon this game
+                    self.abandoned_games += 1
+                    break
+
+                actions_taken += 1
+                self.reward_sum += memory_instance.reward
+                # statistics first, so whoever gets the last transition of a game already sees it counted
+                if self.state.winner:
+                    self.victories[agent.name] += 1
+                    self.games += 1
+                    self.sum_game_lengths += actions_taken
+                yield agent.name, memory_instance
+
+                if self.state.winner:
+                    break
+
+                # let the opponent have a go
+                if current_agent == BoardElement.AGENT_BOT:
+                    current_agent = BoardElement.AGENT_TOP
+                else:
+                    current_agent = BoardElement.AGENT_BOT
+
+            played += 1
+
+
+
+    def train(self, num_games):
+        """ plays until num_games games have finished in total (counting the ones before a resume),
+            each agent remembering its own transitions and learning after every action """
+        if self.games >= num_games:
+            return
+        last_update = self.games
+        for agent_name, memory_instance in self.transitions():
+            agent = self.agents[agent_name]
+            agent.memory.add_sample(memory_instance)
+            agent.q_learn()
+
+            # print an update or us humans to read
+            if self.games - last_update >= constants.PRINT_UPDATE_FREQUENCY:
+                print('\nEpoch {} of {}'.format(self.games, num_games))
+                self.print_details(self.games - last_update)
+                last_update = self.games
+
+            if self.games >= num_games:
+                break
+
+
+
+def main():
+    """ Trains like main.py does, without pygame. Meant for machines that never show the game """
+    with create_session() as sess:
+        game = HeadlessQuoridor(sess)
+
+        print("Learning Initiated...")
+        if constants.NUM_PARALLEL_GAMES > 1:
+            vectorized_game = VectorizedQuoridor(game.agents, game.state_class, game.static_actions, constants.NUM_PARALLEL_GAMES, game.checkpointer, game.games)
+            vectorized_game.train(constants.NUM_GAMES, game.only_inference)
+        else:
+            game.train(constants.NUM_GAMES)
+        game.checkpointer.close()
+    print('Simulation complete')
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from point import Point
+from actions import StaticActions, MoveAction, WallAction
+from agents import TopAgent, BottomAgent
+from numpy_policy import NumpyPolicy
+from model_backends import selected_state_class
+
+import constants
+from constants import BoardElement
+
+
+
+class BatchingPredictor:
+    """ Lets many games share one model without each paying for its own forward pass.
+
+        Games await predict() with one state vector. The first request to arrive opens a batch, which
+        collects whatever else arrives within INFERENCE_BATCH_WINDOW_SECONDS (or until it holds
+        INFERENCE_MAX_BATCH_SIZE states), then all of them go through model.predict_batch together and
+        every game's future gets its own row of Q values. The model runs on a worker thread so the event
+        loop keeps serving sockets while it works
+    """
+    def __init__(self, model, max_batch_size, batch_window):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.requests = None
+        # one thread, so the model is only ever asked one batch at a time
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        # statistics
+        self.batches = 0
+        self.predictions = 0
+
+
+    async def predict(self, state_vector):
+        """ the model's Q values for one state vector """
+        future = asyncio.get_running_loop().create_future()
+        await self.requests.put((state_vector, future))
+        return await future
+
+
+    def start(self):
+        """ starts serving batches on the running event loop, returns the task to cancel when done """
+        # a new queue every time, queues belong to the event loop they're first used on
+        self.requests = asyncio.Queue()
+        return asyncio.ensure_future(self.run())
+
+
+    async def run(self):
+        """ serves batches forever, see start() """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.requests.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.requests.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            states = np.stack([state_vector for state_vector, _ in batch])
+            try:
+                q_values = await loop.run_in_executor(self.executor, self.model.predict_batch, states)
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            self.batches += 1
+            self.predictions += len(batch)
+            for row, (_, future) in enumerate(batch):
+                # a game that went away (closed socket) no longer wants its answer
+                if not future.done():
+                    future.set_result(q_values[row])
+
+
+
+class GameSession:
+    """ One game against the AI. Both sides are agents so the AI sees the board from its own perspective
+        and the human's actions can be checked for legality the same way the AI's are """
+    def __init__(self, predictor, static_actions, state_class, agents, ai_agent):
+        self.predictor = predictor
+        self.static_actions = static_actions
+        self.state = state_class(static_actions)
+        self.agents = agents
+        self.ai_agent = ai_agent
+
+
+    async def ai_action(self):
+        """ picks and applies the AI's greedy action, returns it (from the board's perspective) or None if it's stuck """
+        agent = self.agents[self.ai_agent]
+        legal_mask = agent.legal_action_mask(self.state)
+        if not legal_mask.any():
+            return None
+        q_values = await self.predictor.predict(agent.get_perspective_state(self.state))
+        action_index = int(np.argmax(np.where(legal_mask, q_values, -np.inf)))
+        state_action = agent.action_to_global_and_back(self.static_actions.all_actions[action_index])
+        self.state.apply_action(agent.name, state_action)
+        return state_action
+
+
+    def human_action(self, agent_name, action):
+        """ applies a human's board action if it's legal, returns whether it was.
+            Anything that isn't one of the static actions (a wall off the board, a move too far) never is,
+            and the states' legality checks expect coordinates on the board """
+        if action not in self.static_actions.action_indexes or not self.state.is_legal_action(action, agent_name):
+            return False
+        self.state.apply_action(agent_name, action)
+        return True
+
+
+    def board_text(self):
+        """ the board as text, rows top to bottom: . squares, # walls, B and T the pawns """
+        grid = self.state.build_grid(BoardElement.AGENT_BOT, BoardElement.AGENT_TOP)
+        symbols = {BoardElement.EMPTY: ' ', BoardElement.WALL: '#', BoardElement.SELF_AGENT: 'B', BoardElement.ENEMY_AGENT: 'T'}
+        lines = []
+        for y in range(len(grid)):
+            row = ''
+            for x in range(len(grid)):
+                cell = grid[x][y]
+                if cell == BoardElement.EMPTY and x % 2 == 0 and y % 2 == 0:
+                    row += '.'
+                else:
+                    row += symbols[cell]
+            lines.append(row)
+        lines.append("walls left: B {} T {}".format(self.state.wall_counts[BoardElement.AGENT_BOT], self.state.wall_counts[BoardElement.AGENT_TOP]))
+        return '\n'.join(lines)
+
+
+
+def parse_action(line):
+    """ 'move dx dy' or 'wall x y H|V' to a board action, None if it doesn't parse """
+    words = line.split()
+    try:
+        if len(words) == 3 and words[0] == 'move':
+            return MoveAction(Point(int(words[1]), int(words[2])))
+        if len(words) == 4 and words[0] == 'wall' and words[3].upper() in (BoardElement.WALL_HORIZONTAL, BoardElement.WALL_VERTICAL):
+            return WallAction(Point(int(words[1]), int(words[2])), words[3].upper())
+    except ValueError:
+        pass
+    return None
+
+
+
+class InferenceServer:
+    """ Hosts any number of human vs AI games on a local socket, every AI move going through one BatchingPredictor.
+
+        Line based, connect with something like `nc 127.0.0.1 <port>`. The human plays the bottom pawn (B),
+        moving with 'move dx dy' (down is +y) or placing walls with 'wall x y H' / 'wall x y V'
+    """
+    def __init__(self, model):
+        self.static_actions = StaticActions(constants.BOARD_SIZE)
+        self.state_class = selected_state_class()
+        self.predictor = BatchingPredictor(model, constants.INFERENCE_MAX_BATCH_SIZE, constants.INFERENCE_BATCH_WINDOW_SECONDS)
+
+        # the agents hold no per game state, every session can share them. They never learn here
+        self.agents = {BoardElement.AGENT_BOT: BottomAgent(None, self.static_actions, model),
+                       BoardElement.AGENT_TOP: TopAgent(None, self.static_actions, model)}
+        self.sessions = 0
+
+
+    def new_session(self):
+        return GameSession(self.predictor, self.static_actions, self.state_class, self.agents, BoardElement.AGENT_TOP)
+
+
+    async def handle_client(self, reader, writer):
+        """ plays one game per connection, AI first half of the time """
+        self.sessions += 1
+        session = self.new_session()
+        human = BoardElement.AGENT_BOT
+
+        async def send(text):
+            writer.write((text + '\n').encode())
+            await writer.drain()
+
+        try:
+            await send("you are B. 'move dx dy' or 'wall x y H|V'")
+            if random.random() > 0.5 and await session.ai_action() is None:
+                await send("the AI has no legal action, game abandoned")
+                return
+
+            while session.state.winner is None:
+                await send(session.board_text() + "\nyour move:")
+                line = await reader.readline()
+                if not line:
+                    return
+
+                action = parse_action(line.decode())
+                if action is None or not session.human_action(human, action):
+                    await send("not a legal action")
+                    continue
+                if session.state.winner is not None:
+                    break
+
+                if await session.ai_action() is None:
+                    await send("the AI has no legal action, game abandoned")
+                    return
+
+            await send(session.board_text() + "\n" + ("you win" if session.state.winner == human else "the AI wins"))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+    async def play_ai_game(self):
+        """ the AI against itself, returns the winner (None if it was abandoned). Used to load test the predictor """
+        session = self.new_session()
+        current_agent = random.choice([BoardElement.AGENT_BOT, BoardElement.AGENT_TOP])
+        for _ in range(constants.INFERENCE_MAX_GAME_LENGTH):
+            session.ai_agent = current_agent
+            if await session.ai_action() is None:
+                return None
+            if session.state.winner is not None:
+                return session.state.winner
+            current_agent = BoardElement.AGENT_TOP if current_agent == BoardElement.AGENT_BOT else BoardElement.AGENT_BOT
+        return None
+
+
+    async def evaluate(self, num_games):
+        """ plays num_games AI games concurrently, so their predictions are batched together """
+        batching_task = self.predictor.start()
+        try:
+            return await asyncio.gather(*[self.play_ai_game() for _ in range(num_games)])
+        finally:
+            batching_task.cancel()
+
+
+    async def serve(self, host, port):
+        batching_task = self.predictor.start()
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print("serving games on {}:{}".format(host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batching_task.cancel()
+
+
+
+def main():
+    """ Serves games against the exported policy (see export_policy.py), no tensorflow needed """
+    policy = NumpyPolicy.load(constants.POLICY_FILE)
+    server = InferenceServer(policy)
+    asyncio.run(server.serve(constants.INFERENCE_SERVER_HOST, constants.INFERENCE_SERVER_PORT))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,7 @@
 
-import tensorflow as tf
-
 from game import QuoridorGame
-from model import Model
+from vectorized_game import VectorizedQuoridor
+from model_backends import create_session
 from memory import Memory
 
 import constants
@@ -27,20 +26,26 @@ def main():
         quoridor rules: https://www.ultraboardgames.com/quoridor/game-rules.php
     """
     
-    # tensorflow 1.14-ish session
-    with tf.Session() as sess:
+    # tensorflow 1.14-ish session, or nothing when training with the numpy backend
+    with create_session() as sess:
 
         game = QuoridorGame(sess)
 
-        epoch = 0
         print("Learning Initiated...")
-        while epoch < constants.NUM_GAMES:
-            # print an update or us humans to read
-            if epoch % constants.PRINT_UPDATE_FREQUENCY == 0 and epoch != 0:
-                print('\nEpoch {} of {}'.format(epoch, constants.NUM_GAMES))
-                game.print_details(constants.PRINT_UPDATE_FREQUENCY)
-            game.run()
-            epoch += 1
+        if constants.NUM_PARALLEL_GAMES > 1:
+            vectorized_game = VectorizedQuoridor(game.agents, game.state_class, game.static_actions, constants.NUM_PARALLEL_GAMES, game.checkpointer, game.games)
+            vectorized_game.train(constants.NUM_GAMES, game.only_inference)
+        else:
+            # NUM_GAMES is the total, a resumed game already has some of them behind it
+            last_update = game.games
+            while game.games < constants.NUM_GAMES:
+                # print an update or us humans to read
+                if game.games - last_update >= constants.PRINT_UPDATE_FREQUENCY:
+                    print('\nEpoch {} of {}'.format(game.games, constants.NUM_GAMES))
+                    game.print_details(game.games - last_update)
+                    last_update = game.games
+                game.run()
+        game.checkpointer.close()
     print('Simulation complete')
     pygame.quit()
 
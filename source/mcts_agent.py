@@ -0,0 +1,334 @@
+import copy
+import math
+import time
+import threading
+
+import numpy as np
+
+from agents import TopAgent, BottomAgent
+from numpy_policy import NumpyPolicy
+from actions import StaticActions
+from model_backends import selected_state_class
+from zobrist import TRANSPOSITIONS
+from search_agent import other_agent
+
+import constants
+from constants import BoardElement
+
+
+# exploration constant of the PUCT rule, how much the priors count against what the visits have shown
+C_PUCT = 1.5
+# Q values differ by a few hundredths between actions, this spreads them out before the softmax into priors
+PRIOR_TEMPERATURE = 0.1
+# value of a child nobody has visited yet
+FIRST_PLAY_VALUE = 0.0
+
+# TreePool.status
+UNEXPANDED = 0
+# waiting for its evaluation in some worker's batch
+PENDING = 1
+EXPANDED = 2
+# won, stuck, or out of room in the pool: its value never changes, it's in terminal_value
+TERMINAL = 3
+
+
+
+class TreePool:
+    """ Every node of the search tree in preallocated arrays, node i's fields being field[i], so a search
+        allocates nothing per node and the children of a node can be scored with a few vectorized operations.
+
+        A node's children are allocated together, they're the slice first_child[i] : first_child[i] + num_children[i].
+        Values are from the point of view of the agent that moved into the node. Selections that went through a
+        node and haven't been backed up yet count as lost visits (virtual loss), so the other workers spread out
+        instead of all heading for the same leaf. PUCT only ever needs the counts with the virtual loss in, so
+        that's how they're kept: selections = visits + virtual losses, selection_value = value sum - virtual losses
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.action = np.zeros(capacity, dtype=np.int32)
+        self.prior = np.zeros(capacity, dtype=np.float32)
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        self.selections = np.zeros(capacity, dtype=np.int32)
+        self.selection_value = np.zeros(capacity, dtype=np.float64)
+        self.first_child = np.zeros(capacity, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.terminal_value = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+
+
+    def reset(self):
+        """ empties the pool down to an unexpanded root, node 0 """
+        self.size = 0
+        self.allocate(1)
+
+
+    def allocate(self, count):
+        """ index of the first of count fresh nodes in a row, or None if the pool is full """
+        if self.size + count > self.capacity:
+            return None
+        start = self.size
+        end = start + count
+        for field in (self.prior, self.visits, self.selections, self.selection_value, self.num_children, self.status, self.terminal_value):
+            field[start:end] = 0
+        self.size = end
+        return start
+
+
+
+class MCTSSearch:
+    """ Monte Carlo tree search guided by the Q network, with several worker threads.
+
+        A leaf is evaluated by one model call: the softmax of its legal actions' Q values are its children's
+        priors and the best legal Q value is its value. Each of num_threads workers walks down the tree on its own
+        copy of the board (with push() / pop()), picking children by PUCT and leaving virtual loss on the way,
+        until it holds leaf_batch_size leaves. Those go to model.predict_batch in one call
+        outside the tree lock, which is when the other workers get to select: tensorflow's session and NumPy's
+        matrix multiplies let go of the GIL while they run. Then the leaves are expanded and their values
+        backed up, taking the virtual loss away again. A worker that finds only pending leaves sleeps until
+        someone backs theirs up rather than spinning on the lock
+    """
+    def __init__(self, model, static_actions, time_budget=constants.SEARCH_TIME_SECONDS, num_threads=constants.MCTS_THREADS,
+                 leaf_batch_size=constants.MCTS_LEAF_BATCH_SIZE, pool_size=constants.MCTS_POOL_SIZE):
+        self.model = model
+        self.static_actions = static_actions
+        self.time_budget = time_budget
+        self.num_threads = num_threads
+        self.leaf_batch_size = leaf_batch_size
+
+        self.pool = TreePool(pool_size)
+        self.lock = threading.Lock()
+        # notified after every batch of backups, the tree may have something new to select then
+        self.backed_up = threading.Condition(self.lock)
+        # each agent's action indexes <-> board action indexes, both ways, see Agent.perspective_indexes
+        self.perspective_indexes = {BoardElement.AGENT_BOT: np.arange(len(static_actions.all_actions)),
+                                    BoardElement.AGENT_TOP: static_actions.flipped_indexes}
+
+        self.root_agent = None
+        self.deadline = None
+        # statistics of the last search
+        self.playouts = 0
+        self.batches = 0
+        self.collisions = 0
+        self.seconds = 0
+
+
+
+    def best_action(self, board_state, agent_name):
+        """ the board action index agent_name should play, the root's most visited child, or None if it has no legal action """
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget
+        self.root_agent = agent_name
+        self.pool.reset()
+        self.playouts = 0
+        self.batches = 0
+        self.collisions = 0
+
+        # the root goes first on its own, so the workers have children to spread out over
+        self.run_batch(self.copy_state(board_state), 1)
+        if self.pool.status[0] == EXPANDED:
+            workers = [threading.Thread(target=self.run_worker, args=(self.copy_state(board_state),)) for _ in range(self.num_threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.seconds = time.perf_counter() - start
+
+        pool = self.pool
+        if pool.status[0] != EXPANDED:
+            return None
+        children = slice(pool.first_child[0], pool.first_child[0] + pool.num_children[0])
+        return int(pool.action[children][np.argmax(pool.visits[children])])
+
+
+    def playouts_per_second(self):
+        return self.playouts / self.seconds if self.seconds else 0.0
+
+
+    def copy_state(self, board_state):
+        """ a board of the worker's own, sharing only the static actions """
+        return copy.deepcopy(board_state, {id(self.static_actions): self.static_actions})
+
+
+
+    def run_worker(self, board_state):
+        while time.perf_counter() < self.deadline:
+            self.run_batch(board_state, self.leaf_batch_size)
+
+
+    def run_batch(self, board_state, batch_size):
+        """ selects up to batch_size leaves, evaluates them in one predict_batch and backs them up """
+        leaves = []
+        with self.lock:
+            collided = False
+            for _ in range(batch_size):
+                leaf = self.select(board_state)
+                if leaf is None:
+                    # ran into a leaf that's already waiting on an evaluation, the tree needs those backed up first
+                    self.collisions += 1
+                    collided = True
+                    break
+                if leaf[3] is None:
+                    # terminal, nothing to evaluate
+                    continue
+                leaves.append(leaf)
+
+            if not leaves:
+                if collided:
+                    # nothing to do until another worker backs up its leaves
+                    self.backed_up.wait(max(self.deadline - time.perf_counter(), 0))
+                return
+        q_values = self.model.predict_batch(np.stack([state_vector for _, _, _, state_vector in leaves]))
+
+        with self.lock:
+            self.batches += 1
+            self.playouts += len(leaves)
+            for row, (path, agent_name, legal_indexes, _) in enumerate(leaves):
+                value = self.leaf_value(agent_name, legal_indexes, q_values[row])
+                self.expand(path[-1], agent_name, legal_indexes, q_values[row], value)
+                # the value is for the agent to move at the leaf, the agent that moved into it sees the opposite
+                self.backup(path, -value)
+            self.backed_up.notify_all()
+
+
+
+    def select(self, board_state):
+        """ Walks from the root to a leaf by PUCT, leaving virtual loss along the path. Terminal leaves are
+            backed up straight away. Returns (path, agent to move, legal board action indexes, state vector),
+            the last two None for a terminal leaf, or None if the leaf is already pending """
+        pool = self.pool
+        node = 0
+        path = [0]
+        agent_name = self.root_agent
+        while pool.status[node] == EXPANDED:
+            start = pool.first_child[node]
+            children = slice(start, start + pool.num_children[node])
+            selections = pool.selections[children]
+            scores = np.divide(pool.selection_value[children], selections, out=np.full(len(selections), FIRST_PLAY_VALUE), where=selections > 0)
+            scores += (C_PUCT * math.sqrt(pool.selections[node] + 1)) * pool.prior[children] / (1 + selections)
+            node = start + int(np.argmax(scores))
+
+            board_state.push(self.static_actions.all_actions[pool.action[node]], agent_name)
+            agent_name = other_agent(agent_name)
+            path.append(node)
+
+        leaf = None
+        if pool.status[node] == PENDING:
+            pass
+        elif pool.status[node] == TERMINAL:
+            self.add_virtual_loss(path)
+            self.backup(path, pool.terminal_value[node])
+            leaf = (path, agent_name, None, None)
+        elif board_state.winner is not None:
+            # only the agent that moved here can have won
+            pool.status[node] = TERMINAL
+            pool.terminal_value[node] = constants.REWARD_WIN
+            self.add_virtual_loss(path)
+            self.backup(path, constants.REWARD_WIN)
+            leaf = (path, agent_name, None, None)
+        else:
+            legal_indexes = np.flatnonzero(TRANSPOSITIONS.legal_action_mask(board_state, agent_name))
+            if len(legal_indexes) == 0:
+                # stuck, the game would be abandoned
+                pool.status[node] = TERMINAL
+                pool.terminal_value[node] = 0
+                self.add_virtual_loss(path)
+                self.backup(path, 0)
+                leaf = (path, agent_name, None, None)
+            else:
+                pool.status[node] = PENDING
+                self.add_virtual_loss(path)
+                state_vector = board_state.encode_perspective(agent_name, other_agent(agent_name), agent_name == BoardElement.AGENT_TOP)
+                leaf = (path, agent_name, legal_indexes, state_vector)
+
+        for _ in range(len(path) - 1):
+            board_state.pop()
+        return leaf
+
+
+
+    def leaf_value(self, agent_name, legal_indexes, q_values):
+        """ the leaf's value for agent_name (to move there): its best legal Q value """
+        return float(np.clip(q_values[self.perspective_indexes[agent_name][legal_indexes]].max(), -1, 1))
+
+
+    def expand(self, node, agent_name, legal_indexes, q_values, value):
+        """ gives the leaf one child per legal action, priors from the softmax of their Q values """
+        pool = self.pool
+        start = pool.allocate(len(legal_indexes))
+        if start is None:
+            # no room left, the leaf stays a leaf with its value from now on
+            pool.status[node] = TERMINAL
+            pool.terminal_value[node] = -value
+            return
+
+        # q_values are in agent_name's action indexes, the children hold board action indexes
+        logits = q_values[self.perspective_indexes[agent_name][legal_indexes]] / PRIOR_TEMPERATURE
+        priors = np.exp(logits - logits.max())
+        end = start + len(legal_indexes)
+        pool.action[start:end] = legal_indexes
+        pool.prior[start:end] = priors / priors.sum()
+        pool.first_child[node] = start
+        pool.num_children[node] = len(legal_indexes)
+        pool.status[node] = EXPANDED
+
+
+    def add_virtual_loss(self, path):
+        self.pool.selections[path] += 1
+        self.pool.selection_value[path] -= 1
+
+
+    def backup(self, path, value):
+        """ adds value (for the agent that moved into the leaf) to every node on the path, flipping sides
+            every ply, and takes back the path's virtual loss. The selection was already counted """
+        pool = self.pool
+        # the leaf gets value, its parent -value, and so on up to the root
+        signs = np.where(np.arange(len(path)) % 2 == (len(path) - 1) % 2, 1.0, -1.0)
+        pool.visits[path] += 1
+        pool.selection_value[path] += signs * value + 1
+
+
+
+class MCTSAgent:
+    """ Mixed into TopAgent or BottomAgent, picks its greedy actions by MCTS over its model instead of
+        by the model's Q values alone. Exploration and learning work as for any agent, see search_agent.SearchAgent """
+
+    def greedy_action(self, state_vector, board_state):
+        board_index = self.search.best_action(board_state, self.name)
+        if board_index is None:
+            return None
+        return int(self.perspective_indexes[board_index])
+
+
+
+class TopMCTSAgent(MCTSAgent, TopAgent):
+    def __init__(self, sess, static_actions, model, time_budget=constants.SEARCH_TIME_SECONDS, num_threads=constants.MCTS_THREADS):
+        TopAgent.__init__(self, sess, static_actions, model)
+        self.search = MCTSSearch(model, static_actions, time_budget, num_threads)
+
+
+class BottomMCTSAgent(MCTSAgent, BottomAgent):
+    def __init__(self, sess, static_actions, model, time_budget=constants.SEARCH_TIME_SECONDS, num_threads=constants.MCTS_THREADS):
+        BottomAgent.__init__(self, sess, static_actions, model)
+        self.search = MCTSSearch(model, static_actions, time_budget, num_threads)
+
+
+
+def main():
+    """ Playouts per second of a search from the starting position with the exported policy, for 1 up to MCTS_THREADS threads """
+    static_actions = StaticActions(constants.BOARD_SIZE)
+    state_class = selected_state_class()
+    policy = NumpyPolicy.load(constants.POLICY_FILE)
+
+    num_threads = 1
+    while num_threads <= constants.MCTS_THREADS:
+        search = MCTSSearch(policy, static_actions, num_threads=num_threads)
+        search.best_action(state_class(static_actions), BoardElement.AGENT_BOT)
+        print("{} threads: {:.0f} playouts per second, {} batches, {} collisions".format(
+            num_threads, search.playouts_per_second(), search.batches, search.collisions))
+        num_threads *= 2
+
+
+
+if __name__ == '__main__':
+    main()
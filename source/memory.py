@@ -1,37 +1,296 @@
+import os
+import numpy as np
 
-import random
+import constants
+
+
+# replay files are a header of HEADER_LENGTH int64s followed by max_memory fixed size records
+REPLAY_FILE_MAGIC = 0x51524550
+REPLAY_FILE_VERSION = 1
+HEADER_LENGTH = 8
+HEADER_MAGIC, HEADER_VERSION, HEADER_STATE_SIZE, HEADER_CAPACITY, HEADER_CURSOR, HEADER_SIZE = range(6)
+
+
+
+def replay_record_dtype(state_size):
+    """ layout of one sample in a replay file """
+    return np.dtype([('state', np.float32, (state_size,)), ('action', np.int64), ('reward', np.float32),
+                     ('next_state', np.float32, (state_size,)), ('done', np.bool_)])
+
+
+
+def open_replay_file(path, max_memory, state_size):
+    """ Memory maps a replay file, making it first if it doesn't exist.
+        Returns (header, records), both backed by the file so writing to them writes to disk """
+    record_dtype = replay_record_dtype(state_size)
+    header_bytes = HEADER_LENGTH * np.dtype(np.int64).itemsize
+
+    if not os.path.exists(path):
+        # sparse, the disk only fills up as samples are written
+        with open(path, 'wb') as replay_file:
+            replay_file.truncate(header_bytes + max_memory * record_dtype.itemsize)
+        header = np.memmap(path, dtype=np.int64, mode='r+', shape=(HEADER_LENGTH,))
+        header[:HEADER_SIZE + 1] = (REPLAY_FILE_MAGIC, REPLAY_FILE_VERSION, state_size, max_memory, 0, 0)
+    else:
+        header = np.memmap(path, dtype=np.int64, mode='r+', shape=(HEADER_LENGTH,))
+        if header[HEADER_MAGIC] != REPLAY_FILE_MAGIC or header[HEADER_VERSION] != REPLAY_FILE_VERSION:
+            raise ValueError(path + " is not a replay file this version can read")
+        if header[HEADER_STATE_SIZE] != state_size or header[HEADER_CAPACITY] != max_memory:
+            raise ValueError("{} holds {} samples of state size {}, not {} of state size {}".format(
+                path, header[HEADER_CAPACITY], header[HEADER_STATE_SIZE], max_memory, state_size))
+
+    records = np.memmap(path, dtype=record_dtype, mode='r+', offset=header_bytes, shape=(max_memory,))
+    return header, records
 
 
 class MemoryInstance:
-    """ remember a specific state -> action -> reward, next_state training example """
-    def __init__(self, state, action, reward, next_state):
+    """ remember a specific state -> action -> reward, next_state training example.
+        done is True if the game ended with this action, so there's nothing to bootstrap from next_state """
+    def __init__(self, state, action, reward, next_state, done=False):
         self.state = state
         self.action = action
         self.reward = reward
         self.next_state = next_state
+        self.done = done
 
     def asTuple(self):
-        """ Returns memory instance as a length 4 tuple """
-        return (self.state, self.action, self.reward, self.next_state)
+        """ Returns memory instance as a length 5 tuple """
+        return (self.state, self.action, self.reward, self.next_state, self.done)
 
 
 
 class Memory:
-    """ Memory of recent memory_instances (training examples) that the agent has encountered """
-    def __init__(self, max_memory):
+    """ Memory of recent memory_instances (training examples) that the agent has encountered.
+
+        A ring buffer: every field has its own preallocated column and the newest sample overwrites the
+        oldest once max_memory is reached, so adding is O(1) no matter how big the memory is, and a sampled
+        batch comes out as ready to train arrays from one fancy index per column.
+
+        Given a path, the columns live in a memory mapped replay file instead of RAM. Only the pages that
+        are touched get read, and opening the file again later picks up right where it left off
+    """
+    def __init__(self, max_memory, state_size, path=None):
         self.max_memory = max_memory
-        self.samples = []
-        
+        self.path = path
+
+        if path is None:
+            self.header = None
+            self.records = None
+            self.states = np.zeros((max_memory, state_size), dtype=np.float32)
+            self.actions = np.zeros(max_memory, dtype=np.int64)
+            self.rewards = np.zeros(max_memory, dtype=np.float32)
+            self.next_states = np.zeros((max_memory, state_size), dtype=np.float32)
+            self.dones = np.zeros(max_memory, dtype=bool)
+
+            # next row to write, and how many rows hold samples
+            self.cursor = 0
+            self.size = 0
+        else:
+            # the columns are views of the record fields, so they read and write the file directly
+            self.header, self.records = open_replay_file(path, max_memory, state_size)
+            self.states = self.records['state']
+            self.actions = self.records['action']
+            self.rewards = self.records['reward']
+            self.next_states = self.records['next_state']
+            self.dones = self.records['done']
+
+            self.cursor = int(self.header[HEADER_CURSOR])
+            self.size = int(self.header[HEADER_SIZE])
+
+
+    def __len__(self):
+        return self.size
+
 
     def add_sample(self, memory_instance):
-        """ Adds a memory_instance sample in queue fashion (deletes old ones) """
-        self.samples.append(memory_instance.asTuple())
-        if len(self.samples) > self.max_memory:
-            del self.samples[0]
+        """ Adds a memory_instance sample in queue fashion (overwrites the oldest one when full) """
+        self.states[self.cursor] = memory_instance.state
+        self.actions[self.cursor] = memory_instance.action
+        self.rewards[self.cursor] = memory_instance.reward
+        self.next_states[self.cursor] = memory_instance.next_state
+        self.dones[self.cursor] = memory_instance.done
+
+        self.cursor = (self.cursor + 1) % self.max_memory
+        self.size = min(self.size + 1, self.max_memory)
+        self.write_header()
+
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """ Adds a batch of samples given as arrays, one row per sample, oldest first """
+        count = len(actions)
+        if count > self.max_memory:
+            # only the newest ones would survive anyway
+            states, actions, rewards, next_states, dones = [column[-self.max_memory:] for column in (states, actions, rewards, next_states, dones)]
+            count = self.max_memory
+
+        rows = (self.cursor + np.arange(count)) % self.max_memory
+        self.states[rows] = states
+        self.actions[rows] = actions
+        self.rewards[rows] = rewards
+        self.next_states[rows] = next_states
+        self.dones[rows] = dones
+
+        self.cursor = (self.cursor + count) % self.max_memory
+        self.size = min(self.size + count, self.max_memory)
+        self.write_header()
+
+
+    def write_header(self):
+        """ keeps the replay file's cursor in step with the samples written """
+        if self.header is not None:
+            self.header[HEADER_CURSOR] = self.cursor
+            self.header[HEADER_SIZE] = self.size
+
+
+    def flush(self):
+        """ makes sure everything written so far is on disk (the OS gets there on its own eventually) """
+        if self.header is not None:
+            self.records.flush()
+            self.header.flush()
+
+
+    def get_state(self):
+        """ what a checkpoint needs to put this memory back the way it is now: the cursor, and the samples
+            themselves unless they're in a replay file (which keeps them anyway). Without one this copies the
+            whole memory, on whichever thread asked """
+        state = {'cursor': self.cursor, 'size': self.size}
+        if self.path is None:
+            state.update(states=self.states.copy(), actions=self.actions.copy(), rewards=self.rewards.copy(),
+                         next_states=self.next_states.copy(), dones=self.dones.copy())
+        return state
+
+
+    def set_state(self, state):
+        """ undoes get_state() """
+        if 'states' in state and len(state['actions']) == self.max_memory:
+            self.states[:] = state['states']
+            self.actions[:] = state['actions']
+            self.rewards[:] = state['rewards']
+            self.next_states[:] = state['next_states']
+            self.dones[:] = state['dones']
+        elif self.path is None:
+            # the samples weren't saved (or don't fit), start empty rather than pretend
+            state = {'cursor': 0, 'size': 0}
+        self.cursor = min(int(state['cursor']), self.max_memory - 1)
+        self.size = min(int(state['size']), self.max_memory)
+        self.write_header()
+
 
     def sample(self, no_samples):
-        """ Randomly samples no_samples from recent memory, or all of the samples if there aren't enough"""
-        if no_samples > len(self.samples):
-            return random.sample(self.samples, len(self.samples))
+        """ Randomly samples no_samples from memory, or all of the samples (shuffled) if there aren't enough.
+            Returns the arrays (states, actions, rewards, next_states, dones) """
+        rows, _ = self.sample_rows(no_samples)
+        return self.batch(rows)
+
+
+    def sample_rows(self, no_samples):
+        """ Picks the rows of a batch. Returns (rows, importance sampling weights), the weights are None
+            because uniform sampling doesn't need any correcting """
+        if no_samples >= self.size:
+            rows = np.random.permutation(self.size)
         else:
-            return random.sample(self.samples, no_samples)
\ No newline at end of file
+            # with replacement, drawing distinct rows from millions of samples isn't worth what it costs
+            rows = np.random.randint(0, self.size, no_samples)
+        return rows, None
+
+
+    def batch(self, rows):
+        """ the arrays (states, actions, rewards, next_states, dones) of these rows """
+        return self.states[rows], self.actions[rows], self.rewards[rows], self.next_states[rows], self.dones[rows]
+
+
+    def update_priorities(self, rows, td_errors):
+        """ uniform memory has no priorities, see PrioritizedMemory """
+        pass
+
+
+
+class PrioritizedMemory(Memory):
+    """ Memory that samples transitions in proportion to how wrong the model was about them.
+
+        Almost every transition is worth REWARD_BEING_ALIVE and only the last one of a game pays out
+        REWARD_WIN, uniform sampling hardly ever trains on those. Here each row has a priority
+        (|TD error| + PRIORITY_EPSILON) ** PRIORITY_ALPHA kept in a sum-tree, an array where every node holds the sum of
+        its two children, so sampling and updating a priority are both O(log n). New samples get the
+        highest priority seen so far so they're trained on at least once. The bias that comes from not
+        sampling uniformly is corrected with importance sampling weights, annealed to full strength
+        over PRIORITY_BETA_STEPS batches
+    """
+    def __init__(self, max_memory, state_size, path=None):
+        Memory.__init__(self, max_memory, state_size, path)
+
+        # tree[1] is the root, tree[i] = tree[2i] + tree[2i + 1], and the priority of row r is tree[leaves + r].
+        # leaves is a power of 2 so every leaf is at the same depth
+        self.leaves = 1
+        while self.leaves < max_memory:
+            self.leaves *= 2
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+        self.max_priority = 1.0
+        self.batches_sampled = 0
+
+        # priorities aren't saved in replay files, samples loaded from one all start out at the same priority
+        if self.size > 0:
+            self.set_priorities(np.arange(self.size), self.max_priority)
+
+
+    def set_state(self, state):
+        Memory.set_state(self, state)
+        # priorities aren't checkpointed either
+        self.tree[:] = 0
+        if self.size > 0:
+            self.set_priorities(np.arange(self.size), self.max_priority)
+
+
+    def add_sample(self, memory_instance):
+        row = self.cursor
+        Memory.add_sample(self, memory_instance)
+        self.set_priorities(np.array([row]), self.max_priority)
+
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        rows = (self.cursor + np.arange(min(len(actions), self.max_memory))) % self.max_memory
+        Memory.add_batch(self, states, actions, rewards, next_states, dones)
+        self.set_priorities(rows, self.max_priority)
+
+
+    def set_priorities(self, rows, priorities):
+        """ writes the leaves then recomputes their ancestors, one level of the tree at a time """
+        nodes = rows + self.leaves
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+
+    def sample_rows(self, no_samples):
+        """ Picks no_samples rows with probability proportional to priority (one from each of no_samples equal
+            slices of the total priority). Returns (rows, importance sampling weights) """
+        total = self.tree[1]
+        segment = total / no_samples
+        values = (np.arange(no_samples) + np.random.random(no_samples)) * segment
+        values = np.minimum(values, total * (1 - 1e-9))
+
+        # walk every sample down the tree at once: go left if the value fits in the left child's sum,
+        # otherwise take away the left child's sum and go right
+        nodes = np.ones(no_samples, dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+        rows = np.minimum(nodes - self.leaves, self.size - 1)
+
+        self.batches_sampled += 1
+        beta = constants.PRIORITY_BETA_START + (1 - constants.PRIORITY_BETA_START) * min(1.0, self.batches_sampled / constants.PRIORITY_BETA_STEPS)
+        probabilities = self.tree[rows + self.leaves] / total
+        weights = (self.size * probabilities) ** -beta
+        return rows, (weights / weights.max()).astype(np.float32)
+
+
+    def update_priorities(self, rows, td_errors):
+        """ new priorities from how far off the model's Q values were for these rows """
+        priorities = (np.abs(td_errors) + constants.PRIORITY_EPSILON) ** constants.PRIORITY_ALPHA
+        self.set_priorities(rows, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
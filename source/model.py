@@ -1,7 +1,12 @@
 
 import tensorflow as tf
+import numpy as np
 import os
 
+from numpy_policy import save_layers
+
+import constants
+
 
 LAYER_SIZE = 350
 PROB_WIN_LAYER_SIZE_1 = 100
@@ -15,11 +20,18 @@ TENSORFLOW_CHECKPOINT_FOLDER = 'tensorflow_checkpoint'
 class Model:
     """ Neural network to implement deep Q-learning with memory
     """
+
+    # agents only learn when their model can be trained, see NumpyPolicy
+    trainable = True
+
     def __init__(self, num_states, num_actions, batch_size, restore, sess):
 
         self.num_states = num_states
         self.num_actions = num_actions
         self.batch_size = batch_size
+
+        # bumped on every training step, lets callers tell if predictions they kept are out of date
+        self.version = 0
         
         # define the placeholders
         self.states = None
@@ -31,6 +43,8 @@ class Model:
         
         # now setup the model
         self.define_model()
+        self.define_weight_transfer()
+        self.define_variable_transfer()
 
         self.saver = tf.train.Saver()
         self.init_variables = tf.global_variables_initializer()
@@ -55,6 +69,7 @@ class Model:
     def load(self):
         """ load model parameters from file"""
         self.saver.restore(self.sess, "./" + TENSORFLOW_CHECKPOINT_FOLDER + "/" + TENSORFLOW_SAVE_FILE)
+        self.version += 1
         
         
     def define_model(self):
@@ -62,17 +77,132 @@ class Model:
         self.states = tf.placeholder(shape=[None, self.num_states], dtype=tf.float32)
         self.q_s_a = tf.placeholder(shape=[None, self.num_actions], dtype=tf.float32)
         
-        # create a couple of fully connected hidden layers
-        fc1 = tf.layers.dense(self.states, LAYER_SIZE, activation=tf.nn.relu)
-        fc2 = tf.layers.dense(fc1, LAYER_SIZE, activation=tf.nn.relu)
-        
-        self.logits = tf.layers.dense(fc2, self.num_actions)
-        
-        self.loss = tf.losses.mean_squared_error(self.q_s_a, self.logits)
-        self.optimizer = tf.train.AdamOptimizer().minimize(self.loss)
-        
-        
+        # a couple of fully connected hidden layers, kept as layer objects so the
+        # Q-learning step below can run more than one batch through the same weights
+        self.layers = [tf.layers.Dense(LAYER_SIZE, activation=tf.nn.relu),
+                       tf.layers.Dense(LAYER_SIZE, activation=tf.nn.relu),
+                       tf.layers.Dense(self.num_actions)]
+
+        self.logits = self.forward(self.states)
+
+        # per example weights for the loss, all ones unless train_batch is given some
+        self.sample_weights = tf.placeholder_with_default(tf.ones_like(self.logits[:, :1]), shape=[None, 1])
         
+        self.loss = tf.losses.mean_squared_error(self.q_s_a, self.logits, weights=self.sample_weights)
+        self.adam = tf.train.AdamOptimizer()
+        self.optimizer = self.adam.minimize(self.loss)
+
+        self.define_q_learning()
+        self.define_greedy_actions()
+
+
+
+    def forward(self, inputs):
+        """ runs inputs through the network's layers """
+        for layer in self.layers:
+            inputs = layer(inputs)
+        return inputs
+
+
+
+    def define_q_learning(self):
+        """ The whole deep Q-learning update as one op, so q_learn is a single session call.
+            s and s' go through the network together as one batch, the bellman targets
+            R + gamma * max(Q(s', a')) (just R when the game ended) are built in the graph and trained towards """
+        self.actions = tf.placeholder(shape=[None], dtype=tf.int32)
+        self.rewards = tf.placeholder(shape=[None], dtype=tf.float32)
+        self.next_states = tf.placeholder(shape=[None, self.num_states], dtype=tf.float32)
+        self.dones = tf.placeholder(shape=[None], dtype=tf.float32)
+        self.q_sample_weights = tf.placeholder_with_default(tf.ones_like(self.rewards), shape=[None])
+
+        batch_size = tf.shape(self.states)[0]
+        q_values = self.forward(tf.concat([self.states, self.next_states], axis=0))
+        q_s_a = q_values[:batch_size]
+        # the targets are constants as far as training goes, same as when they were computed outside the graph
+        q_s_a_d = tf.stop_gradient(q_values[batch_size:])
+
+        targets = self.rewards + constants.GAMMA * (1.0 - self.dones) * tf.reduce_max(q_s_a_d, axis=1)
+        q_taken = tf.reduce_sum(q_s_a * tf.one_hot(self.actions, self.num_actions), axis=1)
+        self.td_errors = targets - q_taken
+
+        # same scale as self.loss: the actions that weren't taken are targeted at their own prediction, so they
+        # add nothing but still count towards the mean
+        self.q_loss = tf.reduce_sum(self.q_sample_weights * tf.square(self.td_errors)) / tf.cast(batch_size * self.num_actions, tf.float32)
+        self.q_optimizer = self.adam.minimize(self.q_loss)
+
+
+
+    def define_greedy_actions(self):
+        """ the index of the legal action with the highest Q value for each state in a batch, built once
+            and fed a legal action mask per state (a row with nothing legal gives 0, check for that first) """
+        self.legal_masks = tf.placeholder(shape=[None, self.num_actions], dtype=tf.bool)
+        masked_logits = tf.where(self.legal_masks, self.logits, tf.fill(tf.shape(self.logits), -np.inf))
+        self.greedy_actions = tf.argmax(masked_logits, axis=1)
+
+
+
+    def define_weight_transfer(self):
+        """ ops to read and write every trainable weight as one flat float32 vector,
+            so weights can be copied between processes without a checkpoint """
+        self.weights = tf.trainable_variables()
+        self.weight_shapes = [variable.get_shape().as_list() for variable in self.weights]
+        self.weight_sizes = [int(np.prod(shape)) for shape in self.weight_shapes]
+        self.num_weights = sum(self.weight_sizes)
+
+        self.flat_weights = tf.placeholder(shape=[self.num_weights], dtype=tf.float32)
+        pieces = tf.split(self.flat_weights, self.weight_sizes)
+        self.assign_weights = tf.group(*[variable.assign(tf.reshape(piece, shape))
+                                         for variable, piece, shape in zip(self.weights, pieces, self.weight_shapes)])
+
+
+
+    def define_variable_transfer(self):
+        """ ops to read and write every variable, optimizer state included, see get_variables """
+        self.all_variables = tf.global_variables()
+        self.variable_values = [tf.placeholder(shape=variable.get_shape(), dtype=variable.dtype.base_dtype) for variable in self.all_variables]
+        self.assign_variables = tf.group(*[variable.assign(value) for variable, value in zip(self.all_variables, self.variable_values)])
+
+
+
+    def get_variables(self):
+        """ Returns [(name, value), ...] of every variable in the model, the optimizer's too, as numpy arrays """
+        values = self.sess.run(self.all_variables)
+        return [(variable.name, value) for variable, value in zip(self.all_variables, values)]
+
+    def set_variables(self, named_values):
+        """ Loads what get_variables returned """
+        values = dict(named_values)
+        missing = [variable.name for variable in self.all_variables if variable.name not in values]
+        if missing:
+            raise ValueError("no saved value for " + ", ".join(missing))
+        self.sess.run(self.assign_variables, feed_dict={placeholder: values[variable.name]
+                                                        for variable, placeholder in zip(self.all_variables, self.variable_values)})
+        self.version += 1
+
+
+
+    def get_layer_weights(self):
+        """ Returns [(kernel, bias), ...] of every layer as numpy arrays """
+        return self.sess.run([(layer.kernel, layer.bias) for layer in self.layers])
+
+    def export_policy(self, path):
+        """ writes the weights to an .npz file that numpy_policy.NumpyPolicy can run without tensorflow """
+        save_layers(path, self.get_layer_weights())
+
+
+
+    def get_flat_weights(self):
+        """ Returns all trainable weights concatenated into one float32 vector """
+        return np.concatenate([weight.ravel() for weight in self.sess.run(self.weights)]).astype(np.float32)
+
+    def set_flat_weights(self, flat_weights):
+        """ Loads weights made by get_flat_weights (from this model or another copy of it) """
+        self.sess.run(self.assign_weights, feed_dict={self.flat_weights: flat_weights})
+        # predictions made with the old weights are stale now
+        self.version += 1
+
+
+
     def get_num_actions(self):
         """ Returns the number of possible actions """
         return self.num_actions
@@ -93,6 +223,26 @@ class Model:
         """ Run a batch of states through the model and return a batch of q values. """
         return self.sess.run(self.logits, feed_dict={self.states: states})
     
-    def train_batch(self, x_batch, y_batch):
-        """ Trains the model with a  batch of X (state) -> Y (reward) examples """
-        return self.sess.run([self.optimizer, self.loss], feed_dict={self.states: x_batch, self.q_s_a: y_batch})
\ No newline at end of file
+    def predict_greedy(self, states, legal_masks):
+        """ For a batch of states and their legal action masks, returns the best legal action index of each """
+        return self.sess.run(self.greedy_actions, feed_dict={self.states: states, self.legal_masks: legal_masks})
+    
+    def train_batch(self, x_batch, y_batch, sample_weights=None):
+        """ Trains the model with a  batch of X (state) -> Y (reward) examples,
+            optionally weighting how much each example counts (importance sampling weights) """
+        self.version += 1
+        feed_dict = {self.states: x_batch, self.q_s_a: y_batch}
+        if sample_weights is not None:
+            feed_dict[self.sample_weights] = sample_weights.reshape(-1, 1)
+        return self.sess.run([self.optimizer, self.loss], feed_dict=feed_dict)
+
+    def train_q_batch(self, states, actions, rewards, next_states, dones, sample_weights=None):
+        """ One deep Q-learning step on a batch of (s, a, r, s', done) in a single session call,
+            optionally weighting each example. Returns (loss, td errors) """
+        self.version += 1
+        feed_dict = {self.states: states, self.actions: actions, self.rewards: rewards,
+                     self.next_states: next_states, self.dones: dones}
+        if sample_weights is not None:
+            feed_dict[self.q_sample_weights] = sample_weights
+        _, loss, td_errors = self.sess.run([self.q_optimizer, self.q_loss, self.td_errors], feed_dict=feed_dict)
+        return loss, td_errors
\ No newline at end of file
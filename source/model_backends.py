@@ -0,0 +1,42 @@
+import contextlib
+
+from state import State
+from bitboard_state import BitboardState
+
+import constants
+
+
+BACKENDS = ('tensorflow', 'numpy')
+
+
+
+def create_session(backend=None):
+    """ what the games are constructed with as sess: a tensorflow session for the tensorflow backend,
+        None for numpy, which doesn't need one. Use it in a with statement either way """
+    backend = backend or constants.MODEL_BACKEND
+    if backend == 'tensorflow':
+        # imported here so the numpy backend doesn't need tensorflow installed
+        import tensorflow as tf
+        return tf.Session()
+    return contextlib.nullcontext()
+
+
+
+def selected_state_class():
+    """ the state class every game is played on: bitboard_state.BitboardState, or state.State
+        (the reference implementation) with USE_BITBOARD_STATE off. Both follow the same rules """
+    return BitboardState if constants.USE_BITBOARD_STATE else State
+
+
+
+def create_model(num_states, num_actions, sess, backend=None):
+    """ a fresh trainable Q network of the given backend (constants.MODEL_BACKEND by default),
+        model.Model or numpy_model.NumpyModel. Both have the same methods """
+    backend = backend or constants.MODEL_BACKEND
+    if backend == 'tensorflow':
+        from model import Model
+        return Model(num_states, num_actions, constants.BATCH_SIZE, False, sess)
+    if backend == 'numpy':
+        from numpy_model import NumpyModel
+        return NumpyModel(num_states, num_actions, constants.BATCH_SIZE, False, sess)
+    raise ValueError("backend must be one of " + str(BACKENDS))
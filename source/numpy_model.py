@@ -0,0 +1,238 @@
+import os
+
+import numpy as np
+
+from numpy_policy import NumpyPolicy, save_layers
+
+import constants
+
+
+LAYER_SIZE = 350
+
+NUMPY_SAVE_FILE = 'numpy_model.npz'
+
+# tf.train.AdamOptimizer's defaults
+LEARNING_RATE = 0.001
+BETA_1 = 0.9
+BETA_2 = 0.999
+EPSILON = 1e-8
+
+# same names tensorflow gives Model's layers, so get_variables / set_variables line up between the two backends
+LAYER_NAMES = ['dense', 'dense_1', 'dense_2']
+
+
+
+class NumpyModel(NumpyPolicy):
+    """ model.Model written in NumPy: same network, same loss, same Adam, same methods.
+
+        At this network size and BATCH_SIZE the tensorflow session costs more per call than the math does,
+        here a training step is a handful of matrix multiplies with nothing in between. The backward pass
+        and Adam are written out by hand. Every weight lives in one flat float32 vector (self.layers are views
+        into it), and so do their gradients and Adam's moments, so an Adam step is a few in-place operations
+        on whole vectors rather than a few per layer. Weights start out the way tf.layers.dense starts them
+        (glorot uniform kernels, zero biases)
+    """
+
+    trainable = True
+
+    def __init__(self, num_states, num_actions, batch_size, restore, sess=None):
+        self.batch_size = batch_size
+
+        sizes = [num_states, LAYER_SIZE, LAYER_SIZE, num_actions]
+        layers = []
+        for fan_in, fan_out in zip(sizes[:-1], sizes[1:]):
+            limit = np.sqrt(6.0 / (fan_in + fan_out))
+            layers.append((np.random.uniform(-limit, limit, (fan_in, fan_out)), np.zeros(fan_out)))
+        NumpyPolicy.__init__(self, layers)
+
+        self.shapes = [array.shape for layer in self.layers for array in layer]
+        self.weight_sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.num_weights = sum(self.weight_sizes)
+
+        # kernel, bias, kernel, bias... one after the other, the same order as Model's flat weights
+        self.weights = np.concatenate([array.ravel() for layer in self.layers for array in layer])
+        self.layers = self.layer_views(self.weights)
+        self.gradients = np.zeros_like(self.weights)
+        self.layer_gradients = self.layer_views(self.gradients)
+
+        # Adam's running averages of each weight's gradient and squared gradient, and beta ** step
+        self.first_moment = np.zeros_like(self.weights)
+        self.second_moment = np.zeros_like(self.weights)
+        self.beta_1_power = np.float32(BETA_1)
+        self.beta_2_power = np.float32(BETA_2)
+        # scratch space for the Adam step
+        self.step = np.zeros_like(self.weights)
+
+        if restore:
+            self.load()
+
+
+    def layer_views(self, flat):
+        """ [(kernel, bias), ...] shaped views into a flat vector laid out like self.weights """
+        views = []
+        offset = 0
+        for shape, size in zip(self.shapes, self.weight_sizes):
+            views.append(flat[offset:offset + size].reshape(shape))
+            offset += size
+        return list(zip(views[0::2], views[1::2]))
+
+
+
+    def save(self, path=NUMPY_SAVE_FILE):
+        """ save model parameters (and the optimizer's) to file"""
+        np.savez(path, **{name: value for name, value in self.get_variables()})
+        print("saved to ", os.path.abspath(path))
+
+    def load(self, path=NUMPY_SAVE_FILE):
+        """ load model parameters from file"""
+        with np.load(path) as arrays:
+            self.set_variables([(name, arrays[name]) for name in arrays.files])
+
+
+    def get_batch_size(self):
+        """ Returns the batch size """
+        return self.batch_size
+
+
+
+    def forward_and_remember(self, states):
+        """ forward(), also returning every layer's input for the backward pass """
+        inputs = []
+        outputs = states
+        last = len(self.layers) - 1
+        for index, (kernel, bias) in enumerate(self.layers):
+            inputs.append(outputs)
+            outputs = outputs @ kernel + bias
+            if index != last:
+                np.maximum(outputs, 0, out=outputs)
+        return outputs, inputs
+
+
+    def backward(self, inputs, output_gradient):
+        """ fills self.gradients given d loss / d output """
+        gradient = output_gradient
+        for index in range(len(self.layers) - 1, -1, -1):
+            kernel, _ = self.layers[index]
+            kernel_gradient, bias_gradient = self.layer_gradients[index]
+            np.matmul(inputs[index].T, gradient, out=kernel_gradient)
+            gradient.sum(axis=0, out=bias_gradient)
+            if index > 0:
+                # through this layer's weights, then the relu that made its input
+                gradient = (gradient @ kernel.T) * (inputs[index] > 0)
+
+
+    def apply_gradients(self):
+        """ one Adam step with self.gradients, the same update tf.train.AdamOptimizer makes """
+        learning_rate = LEARNING_RATE * np.sqrt(1 - self.beta_2_power) / (1 - self.beta_1_power)
+        step = self.step
+
+        self.first_moment *= BETA_1
+        np.multiply(self.gradients, 1 - BETA_1, out=step)
+        self.first_moment += step
+
+        self.second_moment *= BETA_2
+        np.square(self.gradients, out=step)
+        step *= 1 - BETA_2
+        self.second_moment += step
+
+        np.sqrt(self.second_moment, out=step)
+        step += EPSILON
+        np.divide(self.first_moment, step, out=step)
+        step *= learning_rate
+        self.weights -= step
+
+        self.beta_1_power *= BETA_1
+        self.beta_2_power *= BETA_2
+        self.version += 1
+
+
+    def train_batch(self, x_batch, y_batch, sample_weights=None):
+        """ Trains the model with a  batch of X (state) -> Y (reward) examples,
+            optionally weighting how much each example counts (importance sampling weights) """
+        outputs, inputs = self.forward_and_remember(np.asarray(x_batch, dtype=np.float32))
+        errors = outputs - y_batch
+        weights = np.ones((len(errors), 1), dtype=np.float32) if sample_weights is None else np.asarray(sample_weights, dtype=np.float32).reshape(-1, 1)
+
+        # mean squared error over every (example, action), like tf.losses.mean_squared_error
+        count = errors.size
+        loss = float(np.sum(weights * np.square(errors)) / count)
+        self.backward(inputs, (2 / count) * weights * errors)
+        self.apply_gradients()
+        return None, loss
+
+
+    def train_q_batch(self, states, actions, rewards, next_states, dones, sample_weights=None):
+        """ One deep Q-learning step on a batch of (s, a, r, s', done), s and s' in one forward pass.
+            Returns (loss, td errors), the same as Model.train_q_batch """
+        batch_size = len(actions)
+        outputs, inputs = self.forward_and_remember(np.concatenate([states, next_states]).astype(np.float32))
+        q_s_a = outputs[:batch_size]
+        q_s_a_d = outputs[batch_size:]
+
+        targets = rewards + constants.GAMMA * (1.0 - dones) * np.amax(q_s_a_d, axis=1)
+        batch_indexes = np.arange(batch_size)
+        td_errors = targets - q_s_a[batch_indexes, actions]
+        weights = np.ones(batch_size, dtype=np.float32) if sample_weights is None else sample_weights
+
+        # only Q(s, a) of the actions taken gets a gradient, the s' half is the target and gets none.
+        # scaled like Model.q_loss
+        count = batch_size * self.num_actions
+        loss = float(np.sum(weights * np.square(td_errors)) / count)
+        output_gradient = np.zeros_like(q_s_a)
+        output_gradient[batch_indexes, actions] = (-2 / count) * weights * td_errors
+
+        # the backward pass only needs the s half
+        self.backward([layer_input[:batch_size] for layer_input in inputs], output_gradient)
+        self.apply_gradients()
+        return loss, td_errors.astype(np.float32)
+
+
+
+    def get_layer_weights(self):
+        """ Returns [(kernel, bias), ...] of every layer """
+        return [(kernel.copy(), bias.copy()) for kernel, bias in self.layers]
+
+    def export_policy(self, path):
+        """ writes the weights to an .npz file that NumpyPolicy can run """
+        save_layers(path, self.layers)
+
+
+    def get_flat_weights(self):
+        """ Returns all weights concatenated into one float32 vector, same order as Model's """
+        return self.weights.copy()
+
+    def set_flat_weights(self, flat_weights):
+        """ Loads weights made by get_flat_weights (from this model, another copy of it or a Model) """
+        self.weights[...] = flat_weights
+        self.version += 1
+
+
+    def get_variables(self):
+        """ Returns [(name, value), ...] of every weight and the optimizer's state, named the way tensorflow names Model's """
+        named_values = []
+        layer_moments = zip(self.layer_views(self.first_moment), self.layer_views(self.second_moment))
+        for name, layer, (first_moment, second_moment) in zip(LAYER_NAMES, self.layers, layer_moments):
+            for part, weight, m, v in zip(('kernel', 'bias'), layer, first_moment, second_moment):
+                named_values.append((name + '/' + part + ':0', weight.copy()))
+                named_values.append((name + '/' + part + '/Adam:0', m.copy()))
+                named_values.append((name + '/' + part + '/Adam_1:0', v.copy()))
+        named_values.append(('beta1_power:0', np.float32(self.beta_1_power)))
+        named_values.append(('beta2_power:0', np.float32(self.beta_2_power)))
+        return named_values
+
+    def set_variables(self, named_values):
+        """ Loads what get_variables returned """
+        values = dict(named_values)
+        missing = [name for name, _ in self.get_variables() if name not in values]
+        if missing:
+            raise ValueError("no saved value for " + ", ".join(missing))
+
+        layer_moments = zip(self.layer_views(self.first_moment), self.layer_views(self.second_moment))
+        for name, layer, (first_moment, second_moment) in zip(LAYER_NAMES, self.layers, layer_moments):
+            for part, weight, m, v in zip(('kernel', 'bias'), layer, first_moment, second_moment):
+                weight[...] = values[name + '/' + part + ':0']
+                m[...] = values[name + '/' + part + '/Adam:0']
+                v[...] = values[name + '/' + part + '/Adam_1:0']
+        self.beta_1_power = np.float32(values['beta1_power:0'])
+        self.beta_2_power = np.float32(values['beta2_power:0'])
+        self.version += 1
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+
+def save_layers(path, layers):
+    """ writes [(kernel, bias), ...] of a dense network to an .npz policy file """
+    arrays = {}
+    for index, (kernel, bias) in enumerate(layers):
+        arrays['kernel_' + str(index)] = np.asarray(kernel, dtype=np.float32)
+        arrays['bias_' + str(index)] = np.asarray(bias, dtype=np.float32)
+    np.savez(path, num_layers=len(layers), **arrays)
+
+
+
+def load_layers(path):
+    """ reads the [(kernel, bias), ...] written by save_layers """
+    with np.load(path) as arrays:
+        return [(arrays['kernel_' + str(index)], arrays['bias_' + str(index)]) for index in range(int(arrays['num_layers']))]
+
+
+
+class NumpyPolicy:
+    """ The Q network with nothing but NumPy, for playing rather than training.
+
+        Exported from a trained Model with export_policy.py, it loads in milliseconds, doesn't need
+        tensorflow installed and has the same predict_one / predict_batch / predict_greedy as Model.
+        Relu on every layer but the last, same as Model.define_model
+    """
+
+    # agents only learn when their model can be trained
+    trainable = False
+
+    def __init__(self, layers):
+        self.layers = [(np.ascontiguousarray(kernel, dtype=np.float32), np.asarray(bias, dtype=np.float32)) for kernel, bias in layers]
+        self.num_states = self.layers[0][0].shape[0]
+        self.num_actions = self.layers[-1][0].shape[1]
+
+        # the weights never change, so Q values that were cached once stay good
+        self.version = 0
+
+
+    @classmethod
+    def load(cls, path):
+        """ policy from an .npz file written by save_layers """
+        return cls(load_layers(path))
+
+
+    def save(self, path):
+        save_layers(path, self.layers)
+
+
+    def get_num_actions(self):
+        """ Returns the number of possible actions """
+        return self.num_actions
+
+    def get_num_states(self):
+        """ Returns the length of the input state """
+        return self.num_states
+
+
+    def forward(self, states):
+        outputs = states
+        last = len(self.layers) - 1
+        for index, (kernel, bias) in enumerate(self.layers):
+            outputs = outputs @ kernel + bias
+            if index != last:
+                np.maximum(outputs, 0, out=outputs)
+        return outputs
+
+
+    def predict_one(self, state):
+        """ Run the state through the network and return the predicted q values, shape (1, num_actions) """
+        return self.forward(np.asarray(state, dtype=np.float32).reshape(1, self.num_states))
+
+    def predict_batch(self, states):
+        """ Run a batch of states through the network and return a batch of q values. """
+        return self.forward(np.asarray(states, dtype=np.float32))
+
+    def predict_greedy(self, states, legal_masks):
+        """ For a batch of states and their legal action masks, returns the best legal action index of each """
+        return np.argmax(np.where(legal_masks, self.predict_batch(states), -np.inf), axis=1)
@@ -0,0 +1,23 @@
+from game import QuoridorGame
+from numpy_policy import NumpyPolicy
+
+import constants
+
+
+
+def main():
+    """ Play the exported policy (see export_policy.py) as a human, without tensorflow.
+        The agents only do inference and never learn. Same keys as main.py """
+    policy = NumpyPolicy.load(constants.POLICY_FILE)
+    game = QuoridorGame(None, policy)
+    game.human_playing = True
+    game.only_inference = True
+
+    # the game window's close button ends this
+    while True:
+        game.run()
+
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,38 @@
+import constants
 
 
 class Point:
-    """ Point class with additional features so that it can be used with the A-star algorithm """
-    
-    X = None
-    Y = None
+    """ Point class with additional features so that it can be used with the A-star algorithm
 
-    def __init__(self, X, Y):
-        self.X = X
-        self.Y = Y
+        Points are immutable and interned: every point on (or just around) the board exists exactly once,
+        Point(x, y) and point + direction hand back that shared instance instead of allocating a new one.
+        Points outside that range (mouse positions in pixels for example) are still made fresh.
+    """
+
+    __slots__ = ('X', 'Y', 'hash')
+
+    def __new__(cls, X, Y):
+        # covers board squares, wall slots, move directions and a square plus a jump
+        if X.__class__ is int and Y.__class__ is int and INTERN_MIN <= X < INTERN_MAX and INTERN_MIN <= Y < INTERN_MAX:
+            return INTERNED_POINTS[X - INTERN_MIN][Y - INTERN_MIN]
+        return cls.create(X, Y)
+
+    @classmethod
+    def create(cls, X, Y):
+        """ builds a new point, bypassing the intern table (Points can't be changed after this) """
+        point = object.__new__(cls)
+        object.__setattr__(point, 'X', X)
+        object.__setattr__(point, 'Y', Y)
+        # Needed for A-star, computed once since points never change
+        object.__setattr__(point, 'hash', hash((X, Y)))
+        return point
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Points are immutable, make a new one instead")
+
+    def __reduce__(self):
+        # lets points be pickled (and sent to other processes), they come back interned
+        return (Point, (self.X, self.Y))
 
     def not_diagonal(self):
         if self.X == 0:
@@ -16,10 +40,10 @@ class Point:
         elif self.Y == 0:
             return  True
         return False
-        
+
     def abs_sum(self):
         return abs(self.X) + abs(self.Y)
-        
+
     def xstr(self,s):
         if s is None:
             return 'NULL'
@@ -27,27 +51,32 @@ class Point:
 
     def __str__(self):
         return "(" + self.xstr(self.X) + "," + self.xstr(self.Y) + ")"
-    
+
     def toTuple(self):
         return (self.X, self.Y)
-    
+
     def __eq__(self, other):
-        #try catch because sometimes comparing actions compars a point to None
-        try:
-            return self.X == other.X and self.Y == other.Y
-        except:
-            return False
-    
+        # sometimes comparing actions compares a point to None, which is just not equal
+        if self is other:
+            return True
+        return other.__class__ is Point and self.X == other.X and self.Y == other.Y
+
     # Needed for A-star
     def __hash__(self):
-        return hash(self.toTuple())
-    
+        return self.hash
+
     def __add__(self, other):
         return Point(self.X + other.X, self.Y + other.Y)
-    
+
     # Needed for A-star
     def __lt__(self, other):
         return self.X < other.X or (self.X == other.X and self.Y < other.Y)
-    
+
     def __repr__(self):
-        return  "Point (" + str(self.X) + ", " + str(self.Y) + ")"
\ No newline at end of file
+        return  "Point (" + str(self.X) + ", " + str(self.Y) + ")"
+
+
+
+INTERN_MIN = -2 * constants.BOARD_SIZE
+INTERN_MAX = 2 * constants.BOARD_SIZE
+INTERNED_POINTS = [[Point.create(X, Y) for Y in range(INTERN_MIN, INTERN_MAX)] for X in range(INTERN_MIN, INTERN_MAX)]
@@ -0,0 +1,158 @@
+import os
+import random
+
+import numpy as np
+
+from numpy_policy import NumpyPolicy, load_layers
+from actions import StaticActions
+from agents import TopAgent, BottomAgent
+from model_backends import selected_state_class
+
+import constants
+from constants import BoardElement
+
+
+PRECISIONS = ('int8', 'float16')
+INT8_MAX = 127
+
+
+
+def quantize_layers(layers, precision):
+    """ [(kernel, bias), ...] to [(quantized kernel, scale, bias), ...].
+        int8 kernels are scaled per layer so the biggest weight maps to 127, float16 kernels keep a scale of 1.
+        Biases are tiny next to the kernels and stay float32 """
+    quantized = []
+    for kernel, bias in layers:
+        if precision == 'int8':
+            scale = max(float(np.abs(kernel).max()), 1e-12) / INT8_MAX
+            quantized_kernel = np.clip(np.round(kernel / scale), -INT8_MAX, INT8_MAX).astype(np.int8)
+        elif precision == 'float16':
+            scale = 1.0
+            quantized_kernel = kernel.astype(np.float16)
+        else:
+            raise ValueError("precision must be one of " + str(PRECISIONS))
+        quantized.append((quantized_kernel, np.float32(scale), np.asarray(bias, dtype=np.float32)))
+    return quantized
+
+
+
+class QuantizedPolicy(NumpyPolicy):
+    """ NumpyPolicy whose kernels are stored as int8 (with a scale per layer) or float16,
+        making the policy file about 4x or 2x smaller.
+
+        NumPy has no int8 or float16 matrix multiply worth using, so the kernel stays in BLAS: the quantized
+        weights are widened to float32 once when loaded (their values don't change, an int8 weight is still one
+        of 255 levels) and each layer's output is multiplied by its scale, x @ (q * s) = (x @ q) * s
+    """
+    def __init__(self, quantized_layers, precision):
+        self.precision = precision
+        self.quantized_layers = quantized_layers
+        self.scales = [scale for _, scale, _ in quantized_layers]
+        NumpyPolicy.__init__(self, [(quantized_kernel.astype(np.float32), bias) for quantized_kernel, _, bias in quantized_layers])
+
+
+    @classmethod
+    def from_layers(cls, layers, precision):
+        """ quantizes a float policy's [(kernel, bias), ...] """
+        return cls(quantize_layers(layers, precision), precision)
+
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            quantized_layers = [(arrays['kernel_' + str(index)], np.float32(arrays['scale_' + str(index)]), arrays['bias_' + str(index)])
+                                for index in range(int(arrays['num_layers']))]
+            return cls(quantized_layers, str(arrays['precision']))
+
+
+    def save(self, path):
+        arrays = {}
+        for index, (quantized_kernel, scale, bias) in enumerate(self.quantized_layers):
+            arrays['kernel_' + str(index)] = quantized_kernel
+            arrays['scale_' + str(index)] = scale
+            arrays['bias_' + str(index)] = bias
+        np.savez(path, num_layers=len(self.quantized_layers), precision=self.precision, **arrays)
+
+
+    def forward(self, states):
+        outputs = states
+        last = len(self.layers) - 1
+        for index, ((kernel, bias), scale) in enumerate(zip(self.layers, self.scales)):
+            outputs = outputs @ kernel
+            if scale != 1.0:
+                outputs *= scale
+            outputs += bias
+            if index != last:
+                np.maximum(outputs, 0, out=outputs)
+        return outputs
+
+
+
+def sample_positions(num_positions):
+    """ (state vectors, legal action masks) of positions reached by random play, from whoever's turn it was """
+    static_actions = StaticActions(constants.BOARD_SIZE)
+    state_class = selected_state_class()
+
+    # the agents are only used for their perspectives and random actions, they never ask their model anything
+    state = state_class(static_actions)
+    placeholder_model = NumpyPolicy([(np.zeros((state.vector_state_size, 1)), np.zeros(1))])
+    agents = {BoardElement.AGENT_BOT: BottomAgent(None, static_actions, placeholder_model),
+              BoardElement.AGENT_TOP: TopAgent(None, static_actions, placeholder_model)}
+
+    states = np.zeros((num_positions, state.vector_state_size), dtype=np.float32)
+    legal_masks = np.zeros((num_positions, len(static_actions.all_actions)), dtype=bool)
+    current_agent = BoardElement.AGENT_BOT
+    for index in range(num_positions):
+        agent = agents[current_agent]
+        agent.get_perspective_state(state, states[index])
+        legal_masks[index] = agent.legal_action_mask(state)
+
+        action_index = agent.random_action(state)
+        if action_index is not None:
+            state.apply_action(agent.name, agent.action_to_global_and_back(static_actions.all_actions[action_index]))
+        if action_index is None or state.winner:
+            state = state_class(static_actions)
+            current_agent = random.choice([BoardElement.AGENT_BOT, BoardElement.AGENT_TOP])
+        else:
+            current_agent = BoardElement.AGENT_TOP if current_agent == BoardElement.AGENT_BOT else BoardElement.AGENT_BOT
+    return states, legal_masks
+
+
+
+def agreement_report(float_policy, quantized_policy, states, legal_masks):
+    """ how often the quantized policy picks the same greedy action as the float one, and how far its Q values drift """
+    has_legal = legal_masks.any(axis=1)
+    states, legal_masks = states[has_legal], legal_masks[has_legal]
+
+    float_actions = float_policy.predict_greedy(states, legal_masks)
+    quantized_actions = quantized_policy.predict_greedy(states, legal_masks)
+    q_error = np.abs(float_policy.predict_batch(states) - quantized_policy.predict_batch(states))
+    return {'positions': len(states),
+            'agreement': float(np.mean(float_actions == quantized_actions)),
+            'mean_q_error': float(q_error.mean()),
+            'max_q_error': float(q_error.max())}
+
+
+
+def main():
+    """ Quantizes the exported policy (see export_policy.py) to every precision, saves them next to it
+        and reports how closely each one follows the float policy """
+    layers = load_layers(constants.POLICY_FILE)
+    float_policy = NumpyPolicy(layers)
+    states, legal_masks = sample_positions(constants.QUANTIZATION_REPORT_POSITIONS)
+
+    print(constants.POLICY_FILE, os.path.getsize(constants.POLICY_FILE), "bytes")
+    for precision in PRECISIONS:
+        quantized_policy = QuantizedPolicy.from_layers(layers, precision)
+        path = os.path.splitext(constants.POLICY_FILE)[0] + '_' + precision + '.npz'
+        quantized_policy.save(path)
+
+        report = agreement_report(float_policy, quantized_policy, states, legal_masks)
+        print(path, os.path.getsize(path), "bytes")
+        print("    greedy action agreement: {:.4f} over {} positions".format(report['agreement'], report['positions']))
+        print("    Q value error: mean {:.6f}, max {:.6f}".format(report['mean_q_error'], report['max_q_error']))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+import time
+import random
+
+import numpy as np
+
+from agents import TopAgent, BottomAgent
+from numpy_policy import NumpyPolicy
+from actions import StaticActions
+from model_backends import selected_state_class
+from zobrist import TRANSPOSITIONS
+
+import constants
+from constants import BoardElement
+
+
+# scores are in path squares: a position is worth (enemy's distance to goal - my distance to goal)
+WIN_SCORE = 1000
+# a win found this many plies from the root still scores above this, see to_table
+WIN_THRESHOLD = WIN_SCORE - 200
+# walls still in hand are worth something, but less than a square of path
+WALL_VALUE = 0.25
+
+# kinds of TranspositionEntry.search_score
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# how many nodes go by between looks at the clock
+NODES_PER_TIME_CHECK = 64
+
+
+
+class SearchTimeout(Exception):
+    """ raised inside the search when the move's time budget runs out """
+    pass
+
+
+
+def other_agent(agent_name):
+    return BoardElement.AGENT_TOP if agent_name == BoardElement.AGENT_BOT else BoardElement.AGENT_BOT
+
+
+
+class AlphaBetaSearch:
+    """ Negamax with alpha-beta pruning, played out on the real board with push() / pop().
+
+        Iterative deepening searches 1 ply, 2 plies, ... until the time budget runs out and keeps the
+        answer of the deepest search that finished. Each position's best action, score and depth are kept
+        in the shared transposition table (keyed by the agent to move), so every iteration tries the
+        previous one's best action first and cuts off positions it already knows well enough.
+        The rest are ordered pawn moves first (the ones that get closer to the goal first), then walls
+        touching the enemy's shortest paths (nearest the enemy's pawn first), then every other wall.
+        Leaves are scored by the difference in goal distances, which the board keeps as distance fields
+    """
+    def __init__(self, static_actions, time_budget=constants.SEARCH_TIME_SECONDS, max_depth=constants.SEARCH_MAX_DEPTH):
+        self.static_actions = static_actions
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+
+        self.num_move_actions = len(static_actions.move_actions)
+        # square offset of each move action and the four squares each wall action touches
+        self.move_offsets = [action.direction.X + action.direction.Y * constants.BOARD_SIZE for action in static_actions.move_actions]
+        self.wall_squares = [[y * constants.BOARD_SIZE + x for x in (action.position.X, action.position.X + 1) for y in (action.position.Y, action.position.Y + 1)]
+                             for action in static_actions.wall_actions]
+
+        self.deadline = None
+        self.nodes = 0
+        # statistics of the last search
+        self.completed_depth = 0
+        self.score = 0
+
+
+
+    def best_action(self, board_state, agent_name):
+        """ the board action index agent_name should play, or None if it has no legal action """
+        legal_indexes = np.flatnonzero(TRANSPOSITIONS.legal_action_mask(board_state, agent_name))
+        if len(legal_indexes) == 0:
+            return None
+
+        self.deadline = time.perf_counter() + self.time_budget
+        self.nodes = 0
+        self.completed_depth = 0
+        best_action = int(legal_indexes[0])
+        for depth in range(1, self.max_depth + 1):
+            try:
+                self.score, best_action = self.search_root(board_state, agent_name, depth)
+            except SearchTimeout:
+                break
+            self.completed_depth = depth
+            # nothing deeper can change a forced result
+            if abs(self.score) > WIN_THRESHOLD:
+                break
+        return best_action
+
+
+
+    def search_root(self, board_state, agent_name, depth):
+        """ (score, best action index) of a depth ply search """
+        alpha = -np.inf
+        best_action = None
+        enemy_name = other_agent(agent_name)
+        for action_index in self.ordered_actions(board_state, agent_name):
+            board_state.push(self.static_actions.all_actions[action_index], agent_name)
+            try:
+                score = -self.negamax(board_state, enemy_name, depth - 1, -np.inf, -alpha, 1)
+            finally:
+                board_state.pop()
+            if best_action is None or score > alpha:
+                alpha, best_action = score, action_index
+
+        self.store(board_state, agent_name, depth, alpha, EXACT, best_action, 0)
+        return alpha, best_action
+
+
+
+    def negamax(self, board_state, agent_name, depth, alpha, beta, ply):
+        """ the position's score for agent_name (to move) searched depth plies deeper, exact if it's
+            between alpha and beta, otherwise only a bound on the side it fell """
+        self.nodes += 1
+        # the first iteration always finishes, there has to be some answer
+        if self.nodes % NODES_PER_TIME_CHECK == 0 and self.completed_depth > 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        if board_state.winner is not None:
+            # only the agent that just moved can have won, the sooner the worse
+            return -(WIN_SCORE - ply)
+        if depth == 0:
+            return self.evaluate(board_state, agent_name)
+
+        entry = TRANSPOSITIONS.entry(board_state.zobrist_hash, agent_name)
+        if entry.search_depth is not None and entry.search_depth >= depth:
+            score = self.from_table(entry.search_score, ply)
+            if entry.search_bound == EXACT:
+                return score
+            if entry.search_bound == LOWER_BOUND:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score
+
+        actions = self.ordered_actions(board_state, agent_name)
+        if not actions:
+            # boxed in by the other pawn, the game would be abandoned
+            return 0
+
+        original_alpha = alpha
+        best_score = -np.inf
+        best_action = None
+        enemy_name = other_agent(agent_name)
+        for action_index in actions:
+            board_state.push(self.static_actions.all_actions[action_index], agent_name)
+            try:
+                score = -self.negamax(board_state, enemy_name, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board_state.pop()
+            if score > best_score:
+                best_score, best_action = score, action_index
+                alpha = max(alpha, score)
+                if alpha >= beta:
+                    break
+
+        if best_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.store(board_state, agent_name, depth, best_score, bound, best_action, ply)
+        return best_score
+
+
+
+    def store(self, board_state, agent_name, depth, score, bound, best_action, ply):
+        entry = TRANSPOSITIONS.entry(board_state.zobrist_hash, agent_name)
+        entry.search_depth = depth
+        entry.search_score = self.to_table(score, ply)
+        entry.search_bound = bound
+        entry.best_action = best_action
+
+
+    def to_table(self, score, ply):
+        """ wins are scored by how many plies from the root they are, the table keeps them relative to the position """
+        if score > WIN_THRESHOLD:
+            return score + ply
+        if score < -WIN_THRESHOLD:
+            return score - ply
+        return score
+
+    def from_table(self, score, ply):
+        if score > WIN_THRESHOLD:
+            return score - ply
+        if score < -WIN_THRESHOLD:
+            return score + ply
+        return score
+
+
+
+    def evaluate(self, board_state, agent_name):
+        """ the position for agent_name: how much shorter its path is than the enemy's, plus a bit for walls in hand """
+        distance, enemy_distance = TRANSPOSITIONS.goal_distances(board_state, agent_name)
+        walls = board_state.wall_counts[agent_name] - board_state.wall_counts[other_agent(agent_name)]
+        return enemy_distance - distance + WALL_VALUE * walls
+
+
+
+    def ordered_actions(self, board_state, agent_name):
+        """ agent_name's legal action indexes, the ones most likely to be best first """
+        legal_indexes = np.flatnonzero(TRANSPOSITIONS.legal_action_mask(board_state, agent_name)).tolist()
+        moves = [index for index in legal_indexes if index < self.num_move_actions]
+        walls = [index for index in legal_indexes if index >= self.num_move_actions]
+
+        field = board_state.distance_field(agent_name)
+        square = board_state.pawn_square(agent_name)
+        moves.sort(key=lambda index: field[square + self.move_offsets[index]])
+
+        if walls:
+            path_steps = self.shortest_path_steps(board_state, other_agent(agent_name))
+            # walls off the enemy's shortest paths go last
+            off_path = len(path_steps)
+            wall_squares = self.wall_squares
+            num_move_actions = self.num_move_actions
+            walls.sort(key=lambda index: min([path_steps.get(wall_square, off_path) for wall_square in wall_squares[index - num_move_actions]]))
+
+        ordered = moves + walls
+        best_action = TRANSPOSITIONS.entry(board_state.zobrist_hash, agent_name).best_action
+        if best_action is not None and best_action in ordered:
+            ordered.remove(best_action)
+            ordered.insert(0, best_action)
+        return ordered
+
+
+    def shortest_path_steps(self, board_state, agent_name):
+        """ {square: steps from agent_name's pawn} of every square on one of its shortest paths to goal """
+        field = board_state.distance_field(agent_name)
+        neighbor_table = board_state.neighbor_table
+        pawn_square = board_state.pawn_square(agent_name)
+        steps = {pawn_square: 0}
+        frontier = [pawn_square]
+        step = 0
+        while frontier:
+            step += 1
+            ring = []
+            for square in frontier:
+                for neighbor in neighbor_table[square]:
+                    if field[neighbor] == field[square] - 1 and neighbor not in steps:
+                        steps[neighbor] = step
+                        ring.append(neighbor)
+            frontier = ring
+        return steps
+
+
+
+class SearchAgent:
+    """ Mixed into TopAgent or BottomAgent, picks its greedy actions by alpha-beta search instead of
+        asking the model. Random exploration and learning work as for any agent, so with a trainable model
+        its games teach the network, with an exported policy (or never exploring) it's a baseline opponent """
+
+    def greedy_action(self, state_vector, board_state):
+        board_index = self.search.best_action(board_state, self.name)
+        if board_index is None:
+            return None
+        # perspective_indexes maps board indexes back to this agent's just the same, flipping twice changes nothing
+        return int(self.perspective_indexes[board_index])
+
+
+
+class TopSearchAgent(SearchAgent, TopAgent):
+    def __init__(self, sess, static_actions, model, time_budget=constants.SEARCH_TIME_SECONDS):
+        TopAgent.__init__(self, sess, static_actions, model)
+        self.search = AlphaBetaSearch(static_actions, time_budget)
+
+
+class BottomSearchAgent(SearchAgent, BottomAgent):
+    def __init__(self, sess, static_actions, model, time_budget=constants.SEARCH_TIME_SECONDS):
+        BottomAgent.__init__(self, sess, static_actions, model)
+        self.search = AlphaBetaSearch(static_actions, time_budget)
+
+
+
+def play_game(agents, state_class, static_actions):
+    """ one game between two agents that only play, returns the winner (None if it was abandoned) """
+    state = state_class(static_actions)
+    current_agent = random.choice([BoardElement.AGENT_BOT, BoardElement.AGENT_TOP])
+    for _ in range(constants.INFERENCE_MAX_GAME_LENGTH):
+        if agents[current_agent].take_action(state, True) is None:
+            return None
+        if state.winner is not None:
+            return state.winner
+        current_agent = other_agent(current_agent)
+    return None
+
+
+
+def main():
+    """ Plays SEARCH_EVALUATION_GAMES games between a search agent (bottom) and the exported policy (top) """
+    static_actions = StaticActions(constants.BOARD_SIZE)
+    state_class = selected_state_class()
+    policy = NumpyPolicy.load(constants.POLICY_FILE)
+    agents = {BoardElement.AGENT_BOT: BottomSearchAgent(None, static_actions, policy),
+              BoardElement.AGENT_TOP: TopAgent(None, static_actions, policy)}
+
+    results = {BoardElement.AGENT_BOT: 0, BoardElement.AGENT_TOP: 0, None: 0}
+    for _ in range(constants.SEARCH_EVALUATION_GAMES):
+        results[play_game(agents, state_class, static_actions)] += 1
+    print("search agent wins: ", results[BoardElement.AGENT_BOT])
+    print("policy wins: ", results[BoardElement.AGENT_TOP])
+    print("abandoned: ", results[None])
+
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,8 @@ import constants
 from actions import StaticActions, MoveAction, WallAction
 
 from astar import a_star
+import zobrist
+from encoder import PerspectiveEncoder
 from constants import BoardElement
 
 
@@ -40,6 +42,19 @@ class State:
         self.full_grid_size = constants.BOARD_SIZE*2 -1
         self.vector_state_size = (self.full_grid_size ** 2) + 2
 
+        # cheap identity for this position, kept up to date by every change to the pawns and walls
+        self.zobrist_hash = zobrist.full_hash(self)
+
+        # one record per push(), so that search can walk down a line of play and back up with pop()
+        self.undo_stack = []
+
+        # neighbor_table[square] = tuple of the squares one open step away, walls only (pawns are checked on the fly)
+        # squares are numbered y * BOARD_SIZE + x. Only the four squares around a wall change when it's placed or removed
+        self.neighbor_table = [self.open_neighbor_squares(square) for square in range(constants.BOARD_SIZE ** 2)]
+
+        # the walls as the NN sees them, kept up to date wall by wall, see encode_perspective()
+        self.encoder = PerspectiveEncoder()
+
 
 
 
@@ -55,6 +70,13 @@ class State:
             
 
 
+    def legal_action_mask(self, agent_name):
+        """ Legality of every action in static_actions.all_actions for this agent, as a numpy bool array
+            in the same order, so that agents can pick an action with one masked argmax or sample"""
+        return np.array([self.is_legal_action(action, agent_name) for action in self.static_actions.all_actions], dtype=bool)
+
+
+
     def legal_move(self, position, move_action):
         """ Determines whether this move_action from this position is legal or not
             Illegal move actions:
@@ -92,16 +114,24 @@ class State:
         return False
 
     
-    def get_valid_neighbors(self, position):
-        """Returns a list of all neighbors (Points) of this position."""
-        valid_neighbors = []
-        move_actions = self.static_actions.move_actions
+    def pawn_square(self, agent_name):
+        """ this agent's square number """
+        position = self.agent_positions[agent_name]
+        return position.Y * constants.BOARD_SIZE + position.X
+
+
+    def open_neighbor_squares(self, square):
+        """ the neighbor_table entry for this square """
+        position = Point(square % constants.BOARD_SIZE, square // constants.BOARD_SIZE)
+        return tuple(neighbor.Y * constants.BOARD_SIZE + neighbor.X for neighbor in self.get_open_neighbors(position))
+
 
-        # works by calling every possible move action on this position and determining if it's valid
-        for action in move_actions:
-            if self.legal_move(position, action):
-                valid_neighbors.append(self.apply_direction(position, action))
-        return valid_neighbors
+    def refresh_neighbor_table(self, position):
+        """ recomputes the neighbor_table entries of the four squares around the wall slot at position """
+        for x in (position.X, position.X + 1):
+            for y in (position.Y, position.Y + 1):
+                square = y * constants.BOARD_SIZE + x
+                self.neighbor_table[square] = self.open_neighbor_squares(square)
 
 
 
@@ -150,16 +180,8 @@ class State:
         if self.get_wall(position) != BoardElement.EMPTY:
             return False
 
-        # need to check if this wall placement will make the game unwinable
-        # aka: boxing in the opponent or yourself (no path to goal)
-        self.place_wall(position, orientation, agent_name)
-        if not self.path_to_goal_exists(BoardElement.AGENT_TOP) or not self.path_to_goal_exists(BoardElement.AGENT_BOT):
-            self.remove_wall(position, agent_name)
-            return False
-        self.remove_wall(position, agent_name)
-
-
         # can't partially overlap other placed walls
+        # (checked before the path test below, which places the wall for real and must never put it on top of another)
         if orientation == BoardElement.WALL_VERTICAL:
             # if position +- 1 is out of bounds, then the placemnt is goood
             if (position.Y != constants.BOARD_SIZE-2 and self.walls[position.X][position.Y + 1] == BoardElement.WALL_VERTICAL) \
@@ -171,6 +193,15 @@ class State:
                 or (position.X != 0 and self.walls[position.X - 1][position.Y] == BoardElement.WALL_HORIZONTAL):
                 return False
 
+
+        # need to check if this wall placement will make the game unwinable
+        # aka: boxing in the opponent or yourself (no path to goal)
+        self.place_wall(position, orientation, agent_name)
+        if not self.path_to_goal_exists(BoardElement.AGENT_TOP) or not self.path_to_goal_exists(BoardElement.AGENT_BOT):
+            self.remove_wall(position, agent_name)
+            return False
+        self.remove_wall(position, agent_name)
+
         return True
 
 
@@ -182,32 +213,84 @@ class State:
     def place_wall(self, position, orientation, agent_name):
         """ Places a wall from agent_name of orientation at this position"""
         self.walls[position.X][position.Y] = orientation
+        self.encoder.place_wall(position.X, position.Y, orientation)
+        self.zobrist_hash ^= zobrist.WALL_KEYS[orientation][position.X * (constants.BOARD_SIZE - 1) + position.Y]
+
+        self.zobrist_hash ^= zobrist.WALL_COUNT_KEYS[agent_name][self.wall_counts[agent_name]]
         self.wall_counts[agent_name] -= 1
+        self.zobrist_hash ^= zobrist.WALL_COUNT_KEYS[agent_name][self.wall_counts[agent_name]]
+
+        self.refresh_neighbor_table(position)
 
 
     def remove_wall(self, position, agent_name):
         """ Removes this wall at this position and refunds it to agent_name"""
+        self.zobrist_hash ^= zobrist.WALL_KEYS[self.walls[position.X][position.Y]][position.X * (constants.BOARD_SIZE - 1) + position.Y]
+        self.encoder.remove_wall(position.X, position.Y, self.walls[position.X][position.Y])
         self.walls[position.X][position.Y] = BoardElement.EMPTY
+
+        self.zobrist_hash ^= zobrist.WALL_COUNT_KEYS[agent_name][self.wall_counts[agent_name]]
         self.wall_counts[agent_name] += 1
+        self.zobrist_hash ^= zobrist.WALL_COUNT_KEYS[agent_name][self.wall_counts[agent_name]]
+
+        self.refresh_neighbor_table(position)
 
     
 
 
     def path_to_goal_exists(self, agent_name):
-        """ Uses A-Star to check if this agent has a path from it's current position
-            to it's goal"""
-        start = self.agent_positions[agent_name]
+        """ Checks if this agent has a path from it's current position to it's goal"""
+        return self.distance_to_goal(agent_name) != -1
+
+
+    def distance_to_goal(self, agent_name):
+        """ Uses A-Star to find the length of this agent's shortest path to it's goal, or -1 if there is none.
+            Only walls count here, the other pawn will move out of the way eventually """
+        position = self.agent_positions[agent_name]
+        start = position.Y * constants.BOARD_SIZE + position.X
 
         if agent_name == BoardElement.AGENT_TOP:
             goal_edge = constants.BOARD_SIZE - 1
         else:
             goal_edge = 0
 
-        goal_test = lambda point : point.Y == goal_edge
-        heuristic = lambda point : abs(point.Y - goal_edge)
+        # searches over square numbers rather than Points, neighbors come straight out of the neighbor table
+        goal_test = lambda square : square // constants.BOARD_SIZE == goal_edge
+        heuristic = lambda square : abs(square // constants.BOARD_SIZE - goal_edge)
+
+        return a_star(self.neighbor_table.__getitem__, start, goal_test, heuristic)
+
+
+    def distance_field(self, agent_name):
+        """ every square's shortest path length to this agent's goal row (walls only), -1 where there is none.
+            Breadth first out of the whole goal row over the neighbor table """
+        field = [-1] * (constants.BOARD_SIZE ** 2)
+        frontier = [square for square in range(constants.BOARD_SIZE ** 2) if square // constants.BOARD_SIZE == self.agent_goals[agent_name]]
+        for square in frontier:
+            field[square] = 0
+
+        distance = 0
+        while frontier:
+            distance += 1
+            ring = []
+            for square in frontier:
+                for neighbor in self.neighbor_table[square]:
+                    if field[neighbor] == -1:
+                        field[neighbor] = distance
+                        ring.append(neighbor)
+            frontier = ring
+        return field
 
-        path_length = a_star(self.get_valid_neighbors, start, goal_test, heuristic)
-        return path_length != -1
+
+    def get_open_neighbors(self, position):
+        """Returns the squares (Points) next to this position that aren't behind a wall, ignoring pawns."""
+        open_neighbors = []
+        for action in self.static_actions.move_actions:
+            new_position = self.apply_direction(position, action)
+            if action.direction.abs_sum() == 1 and 0 <= new_position.X < constants.BOARD_SIZE and 0 <= new_position.Y < constants.BOARD_SIZE:
+                if not self.wall_between(position, new_position):
+                    open_neighbors.append(new_position)
+        return open_neighbors
 
 
 
@@ -221,12 +304,38 @@ class State:
             
 
 
+    def push(self, legal_action, agent_name):
+        """ apply_action() that remembers how to undo itself, see pop().
+            Returns the reward, just like apply_action """
+        if isinstance(legal_action, MoveAction):
+            undo = (agent_name, self.agent_positions[agent_name], None, self.winner, self.zobrist_hash)
+        else:
+            undo = (agent_name, None, legal_action.position, self.winner, self.zobrist_hash)
+        self.undo_stack.append(undo)
+        return self.apply_action(agent_name, legal_action)
+
+
+    def pop(self):
+        """ Undoes the most recent push(): puts the pawn back or takes the wall back (refunding it) """
+        agent_name, position, wall_position, winner, zobrist_hash = self.undo_stack.pop()
+        if wall_position is None:
+            self.agent_positions[agent_name] = position
+        else:
+            self.remove_wall(wall_position, agent_name)
+        self.winner = winner
+        self.zobrist_hash = zobrist_hash
+
+
+
     def apply_move_action(self, agent_name, move_action):
         """ Takes a valid move action from agent_name and updates the state accordingly"""
         position = self.agent_positions[agent_name]
         new_position = self.apply_direction(position, move_action)
         self.agent_positions[agent_name] = new_position
 
+        pawn_keys = zobrist.PAWN_KEYS[agent_name]
+        self.zobrist_hash ^= pawn_keys[position.Y * constants.BOARD_SIZE + position.X] ^ pawn_keys[new_position.Y * constants.BOARD_SIZE + new_position.X]
+
         # If this position matches the current agent's goal
         # then they win and a different reward is returned
         if new_position.Y == self.agent_goals[agent_name]:
@@ -250,6 +359,15 @@ class State:
 
 
 
+    def encode_perspective(self, current_agent, enemy_agent, flipped, out=None):
+        """ The state as a float32 vector for the NN: the same values as build_grid flattened row by row
+            (reversed if flipped), followed by current_agent's and enemy_agent's wall counts.
+            Written into out if it's given, otherwise into a new array """
+        return self.encoder.encode(self.pawn_square(current_agent), self.pawn_square(enemy_agent),
+                                   self.wall_counts[current_agent], self.wall_counts[enemy_agent], flipped, out)
+
+
+
     def build_grid(self, current_agent, enemy_agent):
         """ transforms the state.walls into a grid where each grid space can be a square, a wall or an agent
             BoardElement.EMPTY for empty squres
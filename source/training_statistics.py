@@ -0,0 +1,33 @@
+from constants import BoardElement
+
+
+
+class TrainingStatistics:
+    """ Mixed into every game runner (QuoridorGame, HeadlessQuoridor, VectorizedQuoridor): the statistics
+        they keep while training and the update print_details shows every PRINT_UPDATE_FREQUENCY games.
+        The runner needs agents and a checkpointer, and adds to the statistics as its games finish
+    """
+
+    def reset_statistics(self, games=0):
+        """ games carries on from where a resumed run left off """
+        self.sum_game_lengths = 0
+        self.games = games
+        self.abandoned_games = 0
+        self.victories = {BoardElement.AGENT_TOP: 0, BoardElement.AGENT_BOT: 0}
+        self.reward_sum = 0
+
+
+    def print_details(self, games_per_epoch):
+        """ print details on recent statistics to see how training is coming along"""
+        self.checkpointer.save(self.games)
+
+        print("Top Victories: ", self.victories[BoardElement.AGENT_TOP])
+        print("Bot Victories: ", self.victories[BoardElement.AGENT_BOT])
+        print("Abandoned Games: ", self.abandoned_games)
+        print("Local Average Game Length: ", self.sum_game_lengths / games_per_epoch)
+        print("Local Average Game Reward: ", self.reward_sum / games_per_epoch)
+        self.sum_game_lengths = 0
+        self.reward_sum = 0
+
+        print("Local Average Loss: ", self.agents[BoardElement.AGENT_BOT].get_recent_loss())
+        print('exploration_probability', self.agents[BoardElement.AGENT_TOP].get_exploration_probability())
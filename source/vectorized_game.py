@@ -0,0 +1,154 @@
+import random
+import numpy as np
+
+from training_statistics import TrainingStatistics
+
+import constants
+from constants import BoardElement
+
+
+
+class VectorizedQuoridor(TrainingStatistics):
+    """ Plays num_games independent self-play games in lockstep.
+
+        QuoridorGame.run asks the model for one state at a time, and at these network sizes the session
+        round trip costs far more than the math. Here every step moves each game forward by one ply:
+        all the games' states are encoded into one preallocated array, the model is asked once for all of
+        them with predict_batch, and the transitions come back as arrays. Finished games start over on
+        their own so the batch stays full.
+    """
+    def __init__(self, agents, state_class, static_actions, num_games, checkpointer, games=0):
+        # agents, their shared model and the checkpointer come from a QuoridorGame, so memories and
+        # exploration schedules carry on from (and back into) normal games
+        self.agents = agents
+        self.model = agents[BoardElement.AGENT_BOT].model
+        self.checkpointer = checkpointer
+        self.state_class = state_class
+        self.static_actions = static_actions
+        self.num_games = num_games
+
+        self.num_actions = len(static_actions.all_actions)
+        self.num_move_actions = len(static_actions.move_actions)
+        state_size = self.model.get_num_states()
+
+        self.states = [None] * num_games
+        self.current_agents = [None] * num_games
+        self.actions_taken = np.zeros(num_games, dtype=np.int64)
+
+        # preallocated once, every step writes into these instead of building new arrays
+        self.observations = np.zeros((num_games, state_size), dtype=np.float32)
+        self.next_observations = np.zeros((num_games, state_size), dtype=np.float32)
+        self.legal_masks = np.zeros((num_games, self.num_actions), dtype=bool)
+        self.action_indexes = np.zeros(num_games, dtype=np.int64)
+        self.rewards = np.zeros(num_games, dtype=np.float32)
+        self.dones = np.zeros(num_games, dtype=bool)
+        self.valid = np.zeros(num_games, dtype=bool)
+        self.movers = np.empty(num_games, dtype=object)
+
+        # games carries on from the game this was started from (it may have resumed)
+        self.reset_statistics(games)
+
+        for index in range(num_games):
+            self.reset_game(index)
+
+
+
+    def reset_game(self, index):
+        """ starts a new game in this slot with a random first player """
+        self.states[index] = self.state_class(self.static_actions)
+        self.current_agents[index] = BoardElement.AGENT_BOT if random.random() > 0.5 else BoardElement.AGENT_TOP
+        self.actions_taken[index] = 0
+
+
+
+    def step(self, only_inference=False):
+        """ Moves every game forward by one ply.
+            Returns the transitions as arrays (states, action_indexes, rewards, next_states, dones, movers),
+            one row per game that moved. States and actions are from the mover's perspective, like Agent.take_action
+        """
+        # encode every game from the perspective of whoever's turn it is
+        for index, state in enumerate(self.states):
+            agent = self.agents[self.current_agents[index]]
+            agent.get_perspective_state(state, self.observations[index])
+            self.legal_masks[index] = agent.legal_action_mask(state)
+            self.movers[index] = agent.name
+
+        # epsilon greedy per game, each agent with its own exploration probability
+        exploration = np.array([self.agents[name].exploration_probability for name in self.current_agents])
+        if only_inference:
+            exploring = np.zeros(self.num_games, dtype=bool)
+        else:
+            exploring = np.random.random(self.num_games) <= exploration
+
+        candidates = self.legal_masks.copy()
+        # same training wheels as Agent.random_action: exploring mostly moves
+        moves_only = exploring & (np.random.random(self.num_games) < constants.MOVE_ACTION_PROBABILITY)
+        candidates[moves_only, self.num_move_actions:] = False
+
+        # exploring games pick the legal candidate with the highest random score
+        scores = np.random.random((self.num_games, self.num_actions))
+        scores[~candidates] = -np.inf
+        np.argmax(scores, axis=1, out=self.action_indexes)
+
+        # one forward pass for every other game, masked and argmaxed by the model in the same call
+        greedy = ~exploring
+        if greedy.any():
+            self.action_indexes[greedy] = self.model.predict_greedy(self.observations[greedy], candidates[greedy])
+
+        # games with nothing legal to do get abandoned, just like QuoridorGame.run
+        self.valid[:] = candidates.any(axis=1)
+
+        for agent in self.agents.values():
+            agent.decay_exploration(int(np.sum(self.valid & (self.movers == agent.name))))
+
+        for index in range(self.num_games):
+            if not self.valid[index]:
+                self.abandoned_games += 1
+                self.reset_game(index)
+                continue
+
+            state = self.states[index]
+            agent = self.agents[self.current_agents[index]]
+            state_action = self.static_actions.all_actions[agent.perspective_indexes[self.action_indexes[index]]]
+            self.rewards[index] = state.apply_action(agent.name, state_action)
+            agent.get_perspective_state(state, self.next_observations[index])
+            self.dones[index] = state.winner is not None
+
+            self.actions_taken[index] += 1
+            self.reward_sum += self.rewards[index]
+            if self.dones[index]:
+                self.victories[agent.name] += 1
+                self.games += 1
+                self.sum_game_lengths += self.actions_taken[index]
+                self.reset_game(index)
+            else:
+                self.current_agents[index] = BoardElement.AGENT_TOP if agent.name == BoardElement.AGENT_BOT else BoardElement.AGENT_BOT
+
+        valid = self.valid
+        return (self.observations[valid], self.action_indexes[valid], self.rewards[valid],
+                self.next_observations[valid], self.dones[valid], self.movers[valid])
+
+
+
+    def train_step(self, only_inference=False):
+        """ one step of every game, with each agent remembering its own transitions and learning once from its memory """
+        states, action_indexes, rewards, next_states, dones, movers = self.step(only_inference)
+
+        for name, agent in self.agents.items():
+            rows = movers == name
+            if rows.any():
+                agent.memory.add_batch(states[rows], action_indexes[rows], rewards[rows], next_states[rows], dones[rows])
+                agent.q_learn()
+
+
+
+    def train(self, num_games, only_inference=False):
+        """ keeps stepping until num_games games have finished in total, printing an update every PRINT_UPDATE_FREQUENCY games """
+        printed_games = self.games
+        while self.games < num_games:
+            self.train_step(only_inference)
+            # many games can finish in the same step, so print once enough have finished since the last update
+            if self.games - printed_games >= constants.PRINT_UPDATE_FREQUENCY:
+                print('\nEpoch {} of {}'.format(self.games, num_games))
+                self.print_details(self.games - printed_games)
+                printed_games = self.games
@@ -0,0 +1,126 @@
+import random
+from collections import OrderedDict
+
+import constants
+from constants import BoardElement
+
+
+# one random 64 bit key per (thing, place). A state's hash is the xor of the keys of everything on the board,
+# so a move or a wall only has to xor out what changed and xor in what replaced it
+_key_generator = random.Random(0)
+
+def _random_keys(count):
+    return [_key_generator.getrandbits(64) for _ in range(count)]
+
+# PAWN_KEYS[agent_name][y * BOARD_SIZE + x]
+PAWN_KEYS = {name: _random_keys(constants.BOARD_SIZE ** 2) for name in (BoardElement.AGENT_TOP, BoardElement.AGENT_BOT)}
+# WALL_KEYS[orientation][x * (BOARD_SIZE - 1) + y], same numbering as the walls in State.walls[x][y]
+WALL_KEYS = {orientation: _random_keys((constants.BOARD_SIZE - 1) ** 2) for orientation in (BoardElement.WALL_HORIZONTAL, BoardElement.WALL_VERTICAL)}
+# WALL_COUNT_KEYS[agent_name][walls left]
+WALL_COUNT_KEYS = {name: _random_keys(constants.NUM_WALLS + 1) for name in (BoardElement.AGENT_TOP, BoardElement.AGENT_BOT)}
+
+
+
+def full_hash(state):
+    """ Hashes a state from scratch. States keep their hash up to date as actions are applied,
+        this is only needed to get the first one """
+    zobrist_hash = 0
+    for name, position in state.agent_positions.items():
+        zobrist_hash ^= PAWN_KEYS[name][position.Y * constants.BOARD_SIZE + position.X]
+
+    walls = state.walls
+    for x in range(len(walls)):
+        for y in range(len(walls)):
+            if walls[x][y] != BoardElement.EMPTY:
+                zobrist_hash ^= WALL_KEYS[walls[x][y]][x * (constants.BOARD_SIZE - 1) + y]
+
+    for name, count in state.wall_counts.items():
+        zobrist_hash ^= WALL_COUNT_KEYS[name][count]
+    return zobrist_hash
+
+
+
+
+class TranspositionEntry:
+    """ everything worth remembering about one position from one agent's perspective """
+    def __init__(self):
+        self.legal_mask = None
+        self.goal_distances = None
+        self.q_values = None
+        # q_values go stale as soon as the model trains, so remember which model made them and at which version.
+        # (id(model), model.version), versions alone are counted per model and every model starts at 0
+        self.q_values_version = None
+        # alpha-beta's result for this position with this agent to move, see search_agent.AlphaBetaSearch
+        self.search_depth = None
+        self.search_score = None
+        self.search_bound = None
+        self.best_action = None
+
+
+
+class TranspositionTable:
+    """ Bounded table of TranspositionEntry keyed by (zobrist hash, perspective).
+        The same positions are reached by different move orders over and over in self-play, this lets
+        them skip the legality, distance and model work they already did. The least recently used entry
+        is evicted once max_size is reached """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def entry(self, zobrist_hash, perspective):
+        """ returns the entry for this position, making an empty one if it's new """
+        key = (zobrist_hash, perspective)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = TranspositionEntry()
+            self.entries[key] = entry
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return entry
+
+
+    def legal_action_mask(self, board_state, agent_name):
+        """ board_state.legal_action_mask(agent_name), memoized. The returned array is shared, don't modify it """
+        entry = self.entry(board_state.zobrist_hash, agent_name)
+        if entry.legal_mask is None:
+            self.misses += 1
+            entry.legal_mask = board_state.legal_action_mask(agent_name)
+        else:
+            self.hits += 1
+        return entry.legal_mask
+
+
+    def goal_distances(self, board_state, agent_name):
+        """ (agent's distance to goal, enemy's distance to goal), memoized """
+        entry = self.entry(board_state.zobrist_hash, agent_name)
+        if entry.goal_distances is None:
+            self.misses += 1
+            enemy_name = BoardElement.AGENT_BOT if agent_name == BoardElement.AGENT_TOP else BoardElement.AGENT_TOP
+            entry.goal_distances = (board_state.distance_to_goal(agent_name), board_state.distance_to_goal(enemy_name))
+        else:
+            self.hits += 1
+        return entry.goal_distances
+
+
+    def q_values(self, model, state_vector, board_state, agent_name):
+        """ model.predict_one(state_vector).flatten(), memoized for as long as the model doesn't train.
+            Other models in the same process get their own Q values. state_vector must be board_state from agent_name's perspective """
+        entry = self.entry(board_state.zobrist_hash, agent_name)
+        model_version = (id(model), model.version)
+        if entry.q_values is None or entry.q_values_version != model_version:
+            self.misses += 1
+            entry.q_values = model.predict_one(state_vector).flatten()
+            entry.q_values_version = model_version
+        else:
+            self.hits += 1
+        return entry.q_values
+
+
+
+# shared by both agents, the table is keyed by perspective so they can't see each other's entries
+TRANSPOSITIONS = TranspositionTable(constants.TRANSPOSITION_TABLE_SIZE)
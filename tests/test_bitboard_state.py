@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+
+from actions import StaticActions
+from state import State
+from bitboard_state import BitboardState
+
+import constants
+from constants import BoardElement
+
+
+AGENTS = (BoardElement.AGENT_TOP, BoardElement.AGENT_BOT)
+
+
+
+def test_bitboard_state_agrees_with_state_over_random_games():
+    """ both state classes play the same random games and have to agree on every legal action and goal distance """
+    static_actions = StaticActions(constants.BOARD_SIZE)
+    rng = random.Random(0)
+
+    for _ in range(30):
+        state, bitboard_state = State(static_actions), BitboardState(static_actions)
+        agent_name = rng.choice(AGENTS)
+        for _ in range(100):
+            for name in AGENTS:
+                assert np.array_equal(state.legal_action_mask(name), bitboard_state.legal_action_mask(name))
+                assert state.distance_to_goal(name) == bitboard_state.distance_to_goal(name)
+
+            legal_indexes = np.flatnonzero(state.legal_action_mask(agent_name))
+            if len(legal_indexes) == 0:
+                break
+            action = static_actions.all_actions[rng.choice(legal_indexes)]
+            assert state.apply_action(agent_name, action) == bitboard_state.apply_action(agent_name, action)
+            assert state.winner == bitboard_state.winner
+            if state.winner is not None:
+                break
+            agent_name = BoardElement.AGENT_BOT if agent_name == BoardElement.AGENT_TOP else BoardElement.AGENT_TOP
@@ -0,0 +1,45 @@
+import numpy as np
+
+import numpy_model
+from numpy_model import NumpyModel
+
+import constants
+
+
+
+def q_loss(model, states, actions, targets, sample_weights):
+    """ train_q_batch's loss with the targets held fixed, the way its gradient treats them """
+    q_s_a = model.forward(states.astype(np.float32)).astype(np.float64)[np.arange(len(actions)), actions]
+    return np.sum(sample_weights * np.square(targets - q_s_a)) / (len(actions) * model.num_actions)
+
+
+def test_train_q_batch_gradient_matches_finite_differences(monkeypatch):
+    """ the hand written backward pass against central differences of the loss, on a network small enough to check every weight """
+    monkeypatch.setattr(numpy_model, 'LAYER_SIZE', 5)
+    np.random.seed(0)
+    num_states, num_actions, batch_size = 6, 4, 8
+    model = NumpyModel(num_states, num_actions, batch_size, False)
+
+    states = np.random.randn(batch_size, num_states)
+    next_states = np.random.randn(batch_size, num_states)
+    actions = np.random.randint(num_actions, size=batch_size)
+    rewards = np.random.randn(batch_size)
+    dones = (np.random.rand(batch_size) < 0.3).astype(np.float64)
+    sample_weights = np.random.rand(batch_size)
+
+    weights = model.get_flat_weights()
+    targets = rewards + constants.GAMMA * (1.0 - dones) * np.amax(model.forward(next_states.astype(np.float32)), axis=1)
+    model.train_q_batch(states, actions, rewards, next_states, dones, sample_weights)
+    # the step moved the weights, the gradient it took is still there
+    gradients = model.gradients.astype(np.float64)
+
+    epsilon = 1e-3
+    numeric = np.zeros_like(gradients)
+    for index in range(len(weights)):
+        for sign in (1, -1):
+            nudged = weights.copy()
+            nudged[index] += sign * epsilon
+            model.set_flat_weights(nudged)
+            numeric[index] += sign * q_loss(model, states, actions, targets, sample_weights) / (2 * epsilon)
+
+    assert np.allclose(gradients, numeric, rtol=1e-2, atol=1e-4)
@@ -0,0 +1,58 @@
+import random
+import time
+
+import numpy as np
+
+from actions import StaticActions
+from bitboard_state import BitboardState
+from zobrist import TRANSPOSITIONS
+from search_agent import AlphaBetaSearch, other_agent, WIN_SCORE
+
+import constants
+from constants import BoardElement
+
+
+
+def minimax(search, board_state, agent_name, depth, ply):
+    """ every line played out, no pruning and no table, scored the way AlphaBetaSearch scores them """
+    if board_state.winner is not None:
+        return -(WIN_SCORE - ply)
+    if depth == 0:
+        return search.evaluate(board_state, agent_name)
+    legal_indexes = np.flatnonzero(board_state.legal_action_mask(agent_name))
+    if len(legal_indexes) == 0:
+        return 0
+
+    best_score = -np.inf
+    for action_index in legal_indexes:
+        board_state.push(search.static_actions.all_actions[action_index], agent_name)
+        best_score = max(best_score, -minimax(search, board_state, other_agent(agent_name), depth - 1, ply + 1))
+        board_state.pop()
+    return best_score
+
+
+def test_alpha_beta_agrees_with_minimax():
+    """ alpha-beta's score at depths 1 to 3 against exhaustive minimax, from positions a few random plies into a game """
+    static_actions = StaticActions(constants.BOARD_SIZE)
+    rng = random.Random(0)
+
+    for _ in range(60):
+        board_state = BitboardState(static_actions)
+        agent_name = BoardElement.AGENT_BOT
+        for _ in range(rng.randint(0, 6)):
+            legal_indexes = np.flatnonzero(board_state.legal_action_mask(agent_name))
+            board_state.apply_action(agent_name, static_actions.all_actions[rng.choice(legal_indexes)])
+            if board_state.winner is not None:
+                break
+            agent_name = other_agent(agent_name)
+        if board_state.winner is not None:
+            continue
+
+        # scores left in the table by other positions' searches mustn't help
+        TRANSPOSITIONS.entries.clear()
+        search = AlphaBetaSearch(static_actions, time_budget=60, max_depth=3)
+        search.deadline = time.perf_counter() + 60
+        for depth in (1, 2, 3):
+            score, _ = search.search_root(board_state, agent_name, depth)
+            search.completed_depth = depth
+            assert score == minimax(search, board_state, agent_name, depth, 0)